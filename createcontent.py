@@ -1,7 +1,51 @@
 import pypdf
-from pypdf.generic import NameObject, DictionaryObject, ContentStream, ArrayObject, NumberObject, TextStringObject, ByteStringObject
+from pypdf.generic import NameObject, DictionaryObject, ContentStream, ArrayObject, NumberObject, TextStringObject, ByteStringObject, StreamObject
 import argparse
 
+def create_winansi_font(font_name, font_type='Type1'):
+    font_dict = DictionaryObject()
+    font_dict[NameObject('/Type')] = NameObject('/Font')
+    font_dict[NameObject('/Subtype')] = NameObject('/'+font_type)
+    font_dict[NameObject('/BaseFont')] = NameObject('/'+font_name)
+    font_dict[NameObject('/Encoding')] = NameObject('/WinAnsiEncoding')
+    # Windows-1252 encoding is the most reasonable choice since
+    # ASCII is more limited, and while
+    # Unicode is possible, it is much more cumbersome.
+    return font_dict
+
+def create_charmap_font(writer, font_name, font_type, codes):
+    """Create a font without /Encoding. Its character codes are mapped to Unicode by a ToUnicode CMap only.
+
+    codes maps each character to its one-byte code. This is what subsetting PDF generators tend to produce."""
+    lines = [
+        '/CIDInit /ProcSet findresource begin 12 dict begin begincmap',
+        '/CMapName /Custom def',
+        '1 begincodespacerange <00> <FF> endcodespacerange',
+        f'{len(codes)} beginbfchar',
+    ]
+    lines += [f'<{code:02X}> <{ord(character):04X}>' for character, code in codes.items()]
+    lines += ['endbfchar', 'endcmap CMapName currentdict /CMap defineresource pop end end']
+    to_unicode = StreamObject()
+    to_unicode.set_data('\n'.join(lines).encode('ascii'))
+    font_dict = DictionaryObject()
+    font_dict[NameObject('/Type')] = NameObject('/Font')
+    font_dict[NameObject('/Subtype')] = NameObject('/'+font_type)
+    font_dict[NameObject('/BaseFont')] = NameObject('/ABCDEF+'+font_name) # subset prefix
+    font_dict[NameObject('/ToUnicode')] = writer._add_object(to_unicode)
+    return font_dict
+
+def add_page(writer, width, height, fonts, operations):
+    """Append a page with the given fonts (resource name → font dictionary) and content stream operations."""
+    page = pypdf.PageObject.create_blank_page(writer, width, height)
+    page[NameObject('/Resources')] = DictionaryObject()
+    page['/Resources'][NameObject('/Font')] = DictionaryObject()
+    for font_id, font_dict in fonts.items():
+        page['/Resources']['/Font'][NameObject(font_id)] = font_dict
+    content = ContentStream(None, page.pdf)
+    content.operations = operations
+    page.replace_contents(content)
+    writer.add_page(page)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate a PDF document with one line of text.')
     parser.add_argument('--width', type=int, default=100, help='Width (pt) of the blank page.')
@@ -21,26 +65,11 @@ if __name__ == '__main__':
 This example does not embed the font. For truthful representation, the font must be available to the PDF viewer.''')
 
     writer = pypdf.PdfWriter()
-    page = pypdf.PageObject.create_blank_page(writer, args.width, args.height)
-    page[NameObject('/Resources')] = DictionaryObject()
-    page['/Resources'][NameObject('/Font')] = DictionaryObject()
-    font_dict = DictionaryObject()
-    font_dict[NameObject('/Type')] = NameObject('/Font')
-    font_dict[NameObject('/Subtype')] = NameObject('/'+args.font_type)
-    font_dict[NameObject('/BaseFont')] = NameObject('/'+args.font_name)
-    font_dict[NameObject('/Encoding')] = NameObject('/WinAnsiEncoding')
-    # Windows-1252 encoding is the most reasonable choice since
-    # ASCII is more limited, and while
-    # Unicode is possible, it is much more cumbersome.
-    page['/Resources']['/Font'][NameObject('/F1')] = font_dict
-    content = ContentStream(None, page.pdf)
-    content.operations = [
+    add_page(writer, args.width, args.height, {'/F1': create_winansi_font(args.font_name, args.font_type)}, [
         (ArrayObject(), b'BT'),
         (ArrayObject([NumberObject(args.x), NumberObject(args.y)]), b'Td'),
         ([NameObject('/F1'), NumberObject(args.font_size)], b'Tf'),
         (ArrayObject([ByteStringObject(args.text.encode('Windows-1252'))]), b'Tj'),
         (ArrayObject(), b'ET')
-    ]
-    page.replace_contents(content)
-    writer.add_page(page)
+    ])
     writer.write(args.output)
@@ -0,0 +1,7 @@
+import logging
+from .api import replace, search, Result, PageReport
+from .rules import Rule, RuleSet
+from .codec import MissingGlyphError
+
+# a library does not print. applications decide where messages go.
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -0,0 +1,108 @@
+import io
+import logging
+from typing import List, Union, BinaryIO
+from pypdf import PdfReader
+from .context import FontCodecRegistry
+from .codec import MissingGlyphError
+from .document import compress_content_streams, create_writer, parse_page_selection, process_in_time, process_page, search_document, select_pages, write_contents
+from .rules import RuleSet
+from .prefilter import Prefilter
+from .log import RecordCollector
+
+class PageReport:
+    """What happened on one page."""
+    def __init__(self, page_index:int):
+        self.page_index = page_index
+        self.occurrences = 0
+        self.skipped = False # the page could not contain any match and was not parsed
+        self.timed_out = False # processing the page took longer than page_timeout. it was left as it is.
+        self.warnings = [] # type: List[str]
+        self.missing_glyphs = {} # type: dict[str, set] font name → glyphs which were set in an injected font instead
+    def __repr__(self):
+        return f"PageReport(page_index={self.page_index}, occurrences={self.occurrences})"
+
+class Result:
+    """The outcome of a call to replace.
+
+    output holds the bytes of the modified document. It is None if a missing glyph stopped the replacement."""
+    def __init__(self):
+        self.output = None # type: bytes
+        self.pages = [] # type: List[PageReport]
+        self.occurrences = [] # type: List[int] amount of matches per rule
+        self.missing_glyph_error = None # type: str
+    @property
+    def total(self) -> int:
+        return sum(self.occurrences)
+    @property
+    def warnings(self) -> List[str]:
+        return [warning for page in self.pages for warning in page.warnings]
+    def __repr__(self):
+        return f"Result(total={self.total}, pages={len(self.pages)}, missing_glyph_error={self.missing_glyph_error!r})"
+
+def replace(source:Union[PdfReader, bytes, BinaryIO], rules:RuleSet=None, delete:bool=False, indexes:List[int]=None, font_repository=None, compress:bool=False, incremental:bool=False, compression_level:int=6, text_only:bool=False, page_timeout:float=None, pages:str=None) -> Result:
+    """Search and replace text in a PDF document in memory.
+
+    source is a PdfReader, the bytes of a document or a binary file-like object. It is not modified.
+    With incremental, the output is the original document followed by an update holding the modified objects only.
+    Modified content streams are deflated with compression_level (0 leaves them uncompressed). With compress, unmodified streams
+    stored without compression are deflated, too. With text_only, only the text objects of content streams are parsed.
+    A page taking longer than page_timeout seconds (main thread only) is left as it is and marked as timed out.
+    pages selects the pages to process like --pages (e.g. "1-2,-1"). The others are left as they are and not reported.
+    Either rules (each with a replacement) or delete must be given. Nothing is printed. Warnings are reported in the result
+    and also logged to the logger of this package."""
+    if (rules is None and not delete):
+        raise ValueError("Either rules or delete must be given.")
+    if (rules is not None and not delete):
+        rules.check_replacing()
+    if (isinstance(source, (bytes, bytearray, memoryview))):
+        source = io.BytesIO(source)
+    reader = source if isinstance(source, PdfReader) else PdfReader(source)
+    writer = create_writer(reader, incremental)
+    page_indexes = select_pages(parse_page_selection(pages) if pages is not None else None, len(writer.pages))
+    font_codec_registry = FontCodecRegistry()
+    prefilter = Prefilter(rules) if not delete else Prefilter(None)
+    result = Result()
+    result.occurrences = [0]*len(rules.rules) if rules else []
+    forms = set()
+    try:
+        for page_index in page_indexes:
+            page = writer.pages[page_index]
+            page_report = PageReport(page_index)
+            result.pages.append(page_report)
+            skipped = prefilter.skipped
+            with RecordCollector(logging.WARNING) as collector:
+                try:
+                    (matches, contents), page_report.timed_out = process_in_time(page_index, page_timeout, lambda: process_page(page, page_index, rules, delete, indexes, font_codec_registry, font_repository, prefilter, forms=forms, text_only=text_only), page=page, forms=forms, font_codec_registry=font_codec_registry)
+                finally:
+                    for record in collector.records:
+                        page_report.warnings.append(record.getMessage())
+                        if (hasattr(record, "missing_glyphs")):
+                            page_report.missing_glyphs.setdefault(record.font_name, set()).update(record.missing_glyphs)
+            page_report.skipped = prefilter.skipped > skipped
+            if (contents is not None):
+                write_contents(page, contents)
+            if (rules):
+                counts = rules.count(matches)
+                page_report.occurrences = sum(counts)
+                result.occurrences = [a+b for a, b in zip(result.occurrences, counts)]
+    except MissingGlyphError as mge:
+        result.missing_glyph_error = mge.args[0]
+        return result
+    if (compression_level or compress):
+        compress_content_streams([writer.pages[page_index] for page_index in page_indexes], compression_level, compress)
+    output = io.BytesIO()
+    writer.write(output)
+    result.output = output.getvalue()
+    return result
+
+def search(source:Union[PdfReader, bytes, BinaryIO], rules:RuleSet, max_matches:int=None, pages:str=None, page_timeout:float=None) -> dict:
+    """Search a PDF document without changing it.
+
+    Returns a report with the offsets and the text of all matches per page and content stream (see document.search_document).
+    The search stops after max_matches matches. pages selects the pages to search like in replace.
+    Pages taking longer than page_timeout seconds are listed in timed_out_pages (main thread only, like in replace)."""
+    if (isinstance(source, (bytes, bytearray, memoryview))):
+        source = io.BytesIO(source)
+    reader = source if isinstance(source, PdfReader) else PdfReader(source)
+    page_indexes = select_pages(parse_page_selection(pages), len(reader.pages)) if pages is not None else None
+    return search_document(reader.pages, rules, max_matches, page_indexes=page_indexes, page_timeout=page_timeout)
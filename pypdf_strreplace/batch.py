@@ -0,0 +1,186 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Tuple
+from pypdf import PdfReader
+from .context import FontCodecRegistry
+from .codec import MissingGlyphError
+from .document import compress_content_streams, create_writer, process_document, select_pages
+from .rules import RuleSet
+from .prefilter import Prefilter
+from .main import add_replacement_arguments, get_page_selection, get_rules
+from .log import PACKAGE_LOGGER_NAME, RecordCollector
+
+class BatchWorker:
+    """Processes whole documents. Rules and fonts are prepared once per worker process and used for all documents."""
+    def __init__(self, rules:RuleSet, args_delete:bool, args_indexes:List[int], args_compress:bool, args_compression_level:int, args_incremental:bool, args_streaming:bool, args_text_only:bool, font_repository, args_page_timeout:float=None, args_pages:List[Tuple[int, int]]=None):
+        # messages go to the summary of each file
+        logger = logging.getLogger(PACKAGE_LOGGER_NAME)
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        self.rules = rules
+        self.args_delete = args_delete
+        self.args_indexes = args_indexes
+        self.args_compress = args_compress
+        self.args_compression_level = args_compression_level
+        self.args_incremental = args_incremental
+        self.args_streaming = args_streaming
+        self.args_text_only = args_text_only
+        self.args_page_timeout = args_page_timeout
+        self.args_pages = args_pages # page ranges. each document is selected from on its own.
+        self.font_repository = font_repository # indexed in the main process. fonts are opened here when needed.
+    def process(self, input_filename:str, output_filename:str) -> dict:
+        """Process one document. Never raises. Everything worth knowing goes into the returned summary."""
+        summary = {"input": input_filename, "output": None, "occurrences": 0, "missing_glyphs": None, "error": None}
+        start = time.perf_counter()
+        collector = RecordCollector()
+        try:
+            with collector:
+                writer = create_writer(PdfReader(input_filename), self.args_incremental)
+                prefilter = Prefilter(self.rules) if not self.args_delete else Prefilter(None)
+                page_indexes = select_pages(self.args_pages, len(writer.pages))
+                # font objects are specific to each document, codecs cannot be shared among documents
+                counts = process_document(writer, self.rules, self.args_delete, self.args_indexes, FontCodecRegistry(), self.font_repository, prefilter, streaming=self.args_streaming, text_only=self.args_text_only, page_timeout=self.args_page_timeout, page_indexes=page_indexes)
+                if (self.args_compression_level or self.args_compress):
+                    compress_content_streams([writer.pages[page_index] for page_index in page_indexes], self.args_compression_level, self.args_compress)
+                os.makedirs(os.path.dirname(output_filename) or ".", exist_ok=True)
+                writer.write(output_filename)
+            summary["output"] = output_filename
+            summary["occurrences"] = sum(counts)
+            if (self.rules and len(self.rules.rules) > 1):
+                summary["occurrences_per_rule"] = counts
+            summary["pages"] = len(writer.pages)
+            summary["skipped_pages"] = prefilter.skipped
+        except MissingGlyphError as mge:
+            summary["missing_glyphs"] = mge.args[0]
+        except Exception as e:
+            summary["error"] = f"{type(e).__name__}: {e}"
+        summary["messages"] = [record.getMessage() for record in collector.records]
+        summary["seconds"] = round(time.perf_counter()-start, 3)
+        return summary
+
+worker = None # type: BatchWorker
+
+def initialize_worker(*args):
+    global worker
+    worker = BatchWorker(*args)
+
+def process_file(filenames) -> dict:
+    return worker.process(*filenames)
+
+def get_crash_summary(input_filename:str) -> dict:
+    return {"input": input_filename, "output": None, "occurrences": 0, "missing_glyphs": None, "error": "The worker processing the file died (e.g. it crashed or ran out of memory)."}
+
+def process_in_pool(tasks:List[tuple], jobs:int, worker_arguments:tuple):
+    """Process the tasks in a pool of worker processes. Yields the index of each task and its summary as soon as it is done.
+
+    If a worker dies, the pool is broken and all unfinished tasks fail with it. They are processed again one at a time,
+    so the task which makes the worker die is known. It is reported as failed and the pool is started anew for the others."""
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=initialize_worker, initargs=worker_arguments)
+    futures = {executor.submit(process_file, task): index for index, task in enumerate(tasks)}
+    broken = []
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result()
+        except BrokenProcessPool:
+            broken.append(futures[future])
+    executor.shutdown()
+    executor = None
+    for index in sorted(broken):
+        if (executor is None):
+            executor = ProcessPoolExecutor(max_workers=1, initializer=initialize_worker, initargs=worker_arguments)
+        try:
+            yield index, executor.submit(process_file, tasks[index]).result()
+        except BrokenProcessPool:
+            executor.shutdown(wait=False)
+            executor = None
+            yield index, get_crash_summary(tasks[index][0])
+    if (executor is not None):
+        executor.shutdown()
+
+def find_inputs(input_directory:str=None, manifest:str=None) -> List[tuple]:
+    """Return pairs of input filename and output filename relative to the output directory.
+
+    Files found in a directory keep their path relative to that directory.
+    A manifest lists one input file per line. Empty lines and lines starting with # are ignored.
+    Relative paths in a manifest are relative to the manifest. Outputs are named like the inputs."""
+    inputs = []
+    if (input_directory):
+        for directory, _, filenames in os.walk(input_directory):
+            for filename in sorted(filenames):
+                if (filename.lower().endswith(".pdf")):
+                    path = os.path.join(directory, filename)
+                    inputs.append((path, os.path.relpath(path, input_directory)))
+    else:
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if (not line or line.startswith("#")):
+                    continue
+                path = os.path.join(os.path.dirname(manifest), line)
+                inputs.append((path, os.path.basename(path)))
+    return sorted(inputs) if input_directory else inputs
+
+def main():
+    parser = argparse.ArgumentParser(description="Replace text in many PDF files.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input-dir", type=str, help="Directory with PDF files to process (recursively).")
+    source.add_argument("--manifest", type=str, help="Text file listing the PDF files to process, one per line.")
+    parser.add_argument("--output-dir", type=str, required=True, help="Directory to write the output PDF files to.")
+    add_replacement_arguments(parser)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Amount of worker processes. Defaults to the amount of CPUs.")
+    parser.add_argument("--summary", type=str, help="Write a JSON summary of all files to this file.")
+    args = parser.parse_args()
+    if (args.jobs < 1):
+        parser.error("--jobs must be at least 1.")
+    rules = get_rules(parser, args, not args.delete)
+    page_selection = get_page_selection(parser, args)
+    if (rules is None and not args.delete):
+        parser.error("Batch mode needs --search, --rules or --delete.")
+
+    summaries = []
+    tasks = []
+    outputs = {}
+    for input_filename, output_name in find_inputs(args.input_dir, args.manifest):
+        output_filename = os.path.join(args.output_dir, output_name)
+        if (output_filename in outputs):
+            summary = {"input": input_filename, "output": None, "occurrences": 0, "missing_glyphs": None, "error": f"Output {output_filename} is already written for {outputs[output_filename]}."}
+            print(f"{summary['input']}: {summary['error']}")
+            summaries.append(summary)
+            continue
+        outputs[output_filename] = input_filename
+        tasks.append((input_filename, output_filename))
+
+    font_repository = None
+    if (args.fonts):
+        from .font import create_font_repository
+        font_repository = create_font_repository(args.fonts, args.font_cache)
+    worker_arguments = (rules, args.delete, args.indexes, args.compress, args.compression_level, args.incremental, args.streaming, args.text_only, font_repository, args.page_timeout, page_selection)
+    if (args.jobs == 1):
+        initialize_worker(*worker_arguments)
+        results = enumerate(map(process_file, tasks))
+    else:
+        results = process_in_pool(tasks, args.jobs, worker_arguments)
+    task_summaries = [None]*len(tasks)
+    for index, summary in results:
+        if (summary["error"]):
+            print(f"{summary['input']}: {summary['error']}")
+        elif (summary["missing_glyphs"]):
+            print(f"{summary['input']}: {summary['missing_glyphs']}")
+        else:
+            print(f"{summary['input']}: {summary['occurrences']} occurrences in {summary['seconds']} s.")
+        task_summaries[index] = summary
+    summaries += task_summaries
+
+    failed = sum(1 for summary in summaries if summary["error"] or summary["missing_glyphs"])
+    print(f"Processed {len(summaries)} files, {failed} failed. There are {sum(summary['occurrences'] for summary in summaries)} occurrences.")
+    if (args.summary):
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,46 @@
+class Batch:
+    """Collects the elements of a rewritten collection in one pass.
+
+    Deferred elements are collected right before the next element with the same key."""
+    def __init__(self, key=None):
+        self.key = key
+        self.elements = []
+        self.deferred = {}
+    def append(self, element):
+        if (self.deferred):
+            key = self.key(element)
+            if (key in self.deferred):
+                self.elements.extend(self.deferred.pop(key))
+        self.elements.append(element)
+    def extend(self, elements):
+        for element in elements:
+            self.append(element)
+    def defer(self, element):
+        self.deferred.setdefault(self.key(element), []).append(element)
+
 class Change:
     def __str__(self):
         return self.__class__.__name__
-    def apply(self, element=None, index=None, collection=None):
-        pass
+    def collect(self, batch:Batch, element=None, operation=None, index:int=None):
+        operation.apply_operand_changes()
+        batch.append(element)
 
 class Delete(Change):
-    def apply(self, element=None, index:int=None, collection:list=None):
-        collection.pop(index)
+    def collect(self, batch:Batch, element=None, operation=None, index:int=None):
+        pass
 
 class Cluster(Change):
-    def apply(self, element:tuple=None, index:int=None, collection:list=None):
-        element = collection.pop(index)
-        target_index = next((i for i,e in enumerate(collection) if i >= index and e[1] == element[1]), None)
-        if (target_index is not None):
-            collection.insert(target_index, element)
+    def collect(self, batch:Batch, element:tuple=None, operation=None, index:int=None):
+        # elements which are never followed by a similar element are dropped
+        batch.defer(element)
 
 class Text(Change):
     def __init__(self, text):
         self.text = text
     def __str__(self):
         return f"Set text to „{self.text}“"
-    def apply(self, element=None, index=None, collection=None):
-        element.set_operand_text(self.text, index)
+    def collect(self, batch:Batch, element=None, operation=None, index:int=None):
+        batch.extend(operation.encode_operand_text(self.text, index))
     
 class Surround(Change):
     def __init__(self, prefix, infix, postfix):
@@ -30,7 +49,7 @@ class Surround(Change):
         self.postfix = postfix
     def __str__(self):
         return f"Insert «{self.prefix}» before and «{self.postfix}» after."
-    def apply(self, element=None, index:int=None, collection:list=None):
-        self.infix.apply(element, index, collection)
-        collection[index+1:index+1] = [self.postfix]
-        collection[index:index] = [self.prefix]
\ No newline at end of file
+    def collect(self, batch:Batch, element=None, operation=None, index:int=None):
+        batch.append(self.prefix)
+        self.infix.collect(batch, element, operation, index)
+        batch.append(self.postfix)
\ No newline at end of file
@@ -1,6 +1,12 @@
 from pypdf.generic._base import TextStringObject, ByteStringObject
 from pypdf._font import Font
 from typing import Set, Union
+from functools import cached_property
+import logging
+
+logger = logging.getLogger(__name__)
+
+DECODE_MEMO_SIZE = 4096 # amount of distinct raw operands remembered per font
 
 class MissingGlyphError(KeyError):
     pass
@@ -10,9 +16,9 @@ class ExceptionalTranslator:
         self.trans = str.maketrans(map)
         self.font_name = font_name
     def __getitem__(self, key):
-        if key not in self.trans.keys():
+        if key not in self.trans:
             if (key == 32):
-                print("WARNING: Missing space glyph.")
+                logger.warning("Missing space glyph.")
             else:
                 error_message = f"Replacement glyph »{chr(key)}« (ordinal {key}) is not available on this page for font {self.font_name}."
                 raise MissingGlyphError(error_message)
@@ -21,33 +27,60 @@ class ExceptionalTranslator:
 class FontCodec:
     def __init__(self, font: Font):
         self.font = font
+        self.available_glyphs = frozenset(font.character_map.values())
+        self.decoded = {} # the same headers and footers are decoded over and over again. remember them by their raw bytes.
+    # translation tables are built once per font – not once per operand
+    @cached_property
+    def decode_table(self):
+        return str.maketrans(self.font.character_map)
+    @cached_property
+    def encoding_glyphs(self):
+        return frozenset(self.font.encoding.values())
+    @cached_property
+    def charmap_translator(self):
+        return ExceptionalTranslator({v:k for k,v in self.font.character_map.items()}, self.font.name)
+    @cached_property
+    def single_glyph_translator(self):
+        return ExceptionalTranslator({v:k for k,v in self.font.character_map.items() if not isinstance(v,str) or len(v) == 1}, self.font.name)
     @classmethod
     def from_font(cls, font: Font):
         return cls(font)
     def decode(self, text:Union[TextStringObject,ByteStringObject]):
+        if (isinstance(text, TextStringObject)):
+            key = (TextStringObject, text.get_original_bytes())
+        elif (isinstance(text, ByteStringObject)):
+            key = (ByteStringObject, bytes(text))
+        else:
+            return self._decode(text)
+        plain_text = self.decoded.get(key)
+        if (plain_text is None):
+            plain_text = self._decode(text)
+            if (len(self.decoded) >= DECODE_MEMO_SIZE):
+                del self.decoded[next(iter(self.decoded))] # forget the oldest entry
+            self.decoded[key] = plain_text
+        return plain_text
+    def _decode(self, text:Union[TextStringObject,ByteStringObject]):
         if (isinstance(self.font.encoding, dict)):
             return str(text)
         elif (isinstance(text, TextStringObject) and self.font.encoding == "charmap"):
-            return "".join(text.get_original_bytes().decode('ascii').translate(str.maketrans(self.font.character_map)))
+            return text.get_original_bytes().decode('ascii').translate(self.decode_table)
         elif (isinstance(text, TextStringObject) and isinstance(self.font.encoding, str) and self.font.character_map):
-            return "".join(text.get_original_bytes().decode(self.font.encoding).translate(str.maketrans(self.font.character_map))).lstrip("\ufeff")
+            return text.get_original_bytes().decode(self.font.encoding).translate(self.decode_table).lstrip("\ufeff")
         elif (isinstance(text, ByteStringObject)):
-            return "".join(text.decode(self.font.encoding).translate(str.maketrans(self.font.character_map)))
+            return text.decode(self.font.encoding).translate(self.decode_table)
         else:
             raise NotImplementedError(f"Cannot decode {type(text)} with this {type(self.font.encoding)} encoding: {self.font.encoding}")
     def space_glyph_available(self):
         if (self.font.character_map != {}):
-            available_glyphs = self.font.character_map.values()
-            return " " in available_glyphs
+            return " " in self.available_glyphs
         return True # blindly assume all other fonts and situations come with a space glyph
     def check_glyph_availability(self, text) -> Set[str]:
         if (self.font.character_map != {}):
-            available_glyphs = self.font.character_map.values()
-            return set([glyph for glyph in text if glyph not in available_glyphs and glyph != " "]) # missing space should be handled in set_operand_text()
+            return set([glyph for glyph in text if glyph not in self.available_glyphs and glyph != " "]) # missing space should be handled in encode_operand_text()
         if (isinstance(self.font.encoding, dict)):
             # no idea if this check is actually correct or reliable
             # font.encoding seems to be handled by pypdf internally – no translation needs to happen here
-            return set([glyph for glyph in text if glyph not in self.font.encoding.values() or glyph not in self.font.character_widths or self.font.character_widths[glyph] == 0])
+            return set([glyph for glyph in text if glyph not in self.encoding_glyphs or glyph not in self.font.character_widths or self.font.character_widths[glyph] == 0])
     def encode(self, text, reference):
         #print(f"Encoding „{text}“ to conform to", type(reference))
         missing_glyphs = self.check_glyph_availability(text)
@@ -57,28 +90,31 @@ class FontCodec:
         if (isinstance(self.font.encoding, dict)):
             return TextStringObject(text)
         elif (self.font.encoding == "charmap"):
-            map = {v:k for k,v in self.font.character_map.items()}
-            return ByteStringObject(text.translate(ExceptionalTranslator(map, self.font.name)).encode('ascii'))
+            return ByteStringObject(text.translate(self.charmap_translator).encode('ascii'))
         elif (isinstance(reference, TextStringObject) and isinstance(self.font.encoding, str) and self.font.character_map):
-            map = {v:k for k,v in self.font.character_map.items() if not isinstance(v,str) or len(v) == 1}
-            return TextStringObject(text.translate(ExceptionalTranslator(map, self.font.name)).encode(self.font.encoding))
+            return TextStringObject(text.translate(self.single_glyph_translator).encode(self.font.encoding))
         elif (isinstance(reference, ByteStringObject)):
-            map = {v:k for k,v in self.font.character_map.items() if not isinstance(v,str) or len(v) == 1}
-            return ByteStringObject(text.translate(ExceptionalTranslator(map, self.font.name)).encode(self.font.encoding))
+            return ByteStringObject(text.translate(self.single_glyph_translator).encode(self.font.encoding))
         else:
             raise NotImplementedError(f"Cannot encode this {type(self.font.encoding)} encoding: {self.font.encoding}")
+    def encode_raw(self, text) -> bytes:
+        """Return the bytes which represent text in a content stream – the reverse of decode()."""
+        if (isinstance(self.font.encoding, dict)):
+            return TextStringObject(text).get_encoded_bytes()
+        elif (self.font.encoding == "charmap"):
+            return text.translate(self.charmap_translator).encode('ascii')
+        else:
+            return text.translate(self.single_glyph_translator).encode(self.font.encoding)
 
 class WinAnsiFontCodec(FontCodec):
+    # all glyphs which can be encoded in Windows-1252, determined once for all instances
+    available_glyphs = frozenset(bytes([code]).decode("Windows-1252") for code in range(256) if code not in (0x81, 0x8D, 0x8F, 0x90, 0x9D))
+    def __init__(self, font: Font):
+        self.font = font
     def space_glyph_available(self):
         return True
     def check_glyph_availability(self, text):
-        def is_windows_1252(glyph):
-            try:
-                glyph.encode("Windows-1252")
-                return True
-            except UnicodeEncodeError:
-                return False
-        return [glyph for glyph in text if not is_windows_1252(glyph)]
+        return [glyph for glyph in text if glyph not in self.available_glyphs]
     def decode(self, text):
         raise NotImplementedError("This should never be called.")
     def encode(self, text, reference):
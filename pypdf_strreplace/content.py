@@ -1,83 +1,137 @@
-from .operations import PDFOperation, PDFOperationTJ
+from .operations import PDFOperation, PDFTextOperation
 from .changes import *
 from typing import List
 from pypdf.generic import NumberObject, NameObject
-import re
-from .context import Context
+from array import array
+from bisect import bisect_left, bisect_right
+from .context import Context, FontState
+from .rules import RuleSet
+from .stats import Stats, NULL_STATS
+from .textobjects import TextObjectStream
+from .pagecontents import PageContents
+import logging
 
-def extract_text(operations: List[PDFOperation]):
-    text = ""
-    for operation in operations:
-        text += "".join([getattr(operand, "plain_text", "") for operand in operation.get_relevant_operands()])
-    return text
+logger = logging.getLogger(__name__)
+
+class OffsetMap:
+    """Remembers which operand each character of the flattened plain text came from.
+
+    ends holds the cumulative text length after each operand which contributes text.
+    operations and operand_indexes hold the position of that operand in the content stream."""
+    def __init__(self):
+        self.text = ""
+        self.ends = array("q")
+        self.operations = array("q")
+        self.operand_indexes = array("l")
+    def start_of(self, position):
+        return self.ends[position-1] if position else 0
+    def locate(self, match):
+        """Return the positions of the first and the last operand covered by match."""
+        first = bisect_right(self.ends, match.start(0))
+        last = max(first, bisect_left(self.ends, match.end(0)))
+        return first, last
+
+def extract_text(operations: List[PDFOperation]) -> OffsetMap:
+    offset_map = OffsetMap()
+    parts = []
+    length = 0
+    for operation_index, operation in enumerate(operations):
+        if (isinstance(operation, PDFTextOperation)):
+            for operand_index, plain_text in enumerate(operation.plain_texts):
+                if (plain_text is not None):
+                    parts.append(plain_text)
+                    length += len(plain_text)
+                    offset_map.ends.append(length)
+                    offset_map.operations.append(operation_index)
+                    offset_map.operand_indexes.append(operand_index)
+    offset_map.text = "".join(parts)
+    return offset_map
 
-def schedule_replacements(operations, matches, args_replace):
-    text = ""
+def extract_content_text(content, context:Context) -> OffsetMap:
+    """Parse a content stream and flatten its text without scheduling any changes."""
+    return extract_text([PDFOperation.from_tuple(operands, operator, context) for operands, operator in content.operations])
+
+def schedule_replacements(operations, low_level_operations, matches, rules:RuleSet, offset_map:OffsetMap):
+    # look up the first and last operand of each match once – instead of gathering the text again
+    spans = [offset_map.locate(match) for match in matches]
+    next_match_index = 0
+    position = 0 # position of the current operand in offset_map
     match = None
-    matches = matches[:]
+    last_position = None
     first_operation = None
-    first_operand = None
-    for operation in operations:
-        for operand in operation.get_relevant_operands():
-            if (hasattr(operand, "plain_text")):
-                previous_length = len(text)
-                text += operand.plain_text
-                while (matches or match):
-                    if (match):
-                        if (len(text) >= match.end(0)):
-                            # we have enough text to cover the end of the current match
-                            postfix = operand.plain_text[match.end(0)-previous_length:].strip("\n") # see prefix
-                            postfix = match.re.sub(args_replace, postfix) if args_replace is not None else postfix # see prefix
-                            new_text = prefix+match.expand(args_replace)+postfix if args_replace is not None else prefix+match.group(0)+postfix
-                            first_operand.scheduled_change = Text(new_text)
-                            if (operand != first_operand):
-                                # the match spans multiple operands
-                                # the first operand receives the replacement text in its entirety (with postfix)
-                                # we do not need the current operand anymore. mark current operand for deletion
-                                operand.scheduled_change = Delete()
-                            # we changed an operand in the operation the match begun in
-                            # this might be the current operation or a previous one
-                            first_operation.scheduled_change = Change()
-                            if (operation != first_operation):
-                                # the match spans multiple operations
-                                # the first operations receives the replacement text in its entirety (with postfix)
-                                # we do not need the current operations anymore. mark current operations for deletion
-                                operation.scheduled_change = Delete()
-                                if (operation.operator in ["TJ"]):
-                                    operand_changes = set([c.__class__.__name__ if c else c for c in [getattr(op, "scheduled_change", None) for op in operation.get_relevant_operands()]])
-                                    if (operand_changes-set([Delete.__name__])):
-                                        #print(f"But wait: Not all the operation's operands are going to be deleted! The operation must be changed, not deleted.")
-                                        operation.scheduled_change = Change()
-                            # reset text gathering metadata for next match
-                            match = None
-                            first_operation = None
-                            first_operand = None
-                        else:
-                            # match exists, but the current text does not reach the end
-                            # quit looking here and get more text
-                            break
-                    if (matches):
-                        if (len(text) > matches[0].start(0)):
-                            match = matches[0]
-                            matches.pop(0)
-                            # newlines do not actually occur in the PDF. they have been added by us for visual representation. they must be removed here
-                            prefix = operand.plain_text[:match.start(0)-previous_length].strip("\n")
-                            # one operand might contain multiple matches. since we are focussing on the current match, we must re-do the search and replace in the prefix
-                            prefix = match.re.sub(args_replace, prefix) if args_replace is not None else prefix
-                            first_operation = operation
-                            first_operand = operand
-                        else:
-                            # match exists, but the current text does not reach the start
-                            # quit looking here and get more text
-                            break
-            if (operation.operator in ["TJ", "Tj"] and first_operand is not None and not hasattr(operand, "scheduled_change")):
-                # delete operands containing replaced text
-                operand.scheduled_change = Delete()
-        if (first_operation is not None and not hasattr(operation, "scheduled_change")):
+    first_operand_index = None
+    for operation_index, operation in enumerate(operations):
+        if (operation is None):
+            if (first_operation is not None):
+                # the match spans multiple operations
+                # the current operation is not related to text at all and must be removed to avoid confusion
+                operands, operator = low_level_operations[operation_index]
+                operation = operations[operation_index] = PDFOperation(operands, operator.decode("ascii"))
+                operation.scheduled_change = Delete()
+            continue
+        if (isinstance(operation, PDFTextOperation)):
+            for operand_index, plain_text in enumerate(operation.plain_texts):
+                if (plain_text is not None):
+                    previous_length = offset_map.start_of(position)
+                    while (next_match_index < len(matches) or match):
+                        if (match):
+                            if (position >= last_position):
+                                # we have enough text to cover the end of the current match
+                                postfix = plain_text[match.end(0)-previous_length:].strip("\n") # see prefix
+                                postfix = rules.sub(postfix) if rules.replacing else postfix # see prefix
+                                new_text = prefix+rules.expand(match)+postfix if rules.replacing else prefix+match.group(0)+postfix
+                                first_operation.operand_changes[first_operand_index] = Text(new_text)
+                                if (operation is not first_operation or operand_index != first_operand_index):
+                                    # the match spans multiple operands
+                                    # the first operand receives the replacement text in its entirety (with postfix)
+                                    # we do not need the current operand anymore. mark current operand for deletion
+                                    operation.operand_changes[operand_index] = Delete()
+                                # we changed an operand in the operation the match begun in
+                                # this might be the current operation or a previous one
+                                first_operation.scheduled_change = Change()
+                                if (operation is not first_operation):
+                                    # the match spans multiple operations
+                                    # the first operations receives the replacement text in its entirety (with postfix)
+                                    # we do not need the current operations anymore. mark current operations for deletion
+                                    operation.scheduled_change = Delete()
+                                    if (operation.operator in ["TJ"]):
+                                        if (not all(isinstance(operation.operand_changes.get(i), Delete) for i in range(len(operation.plain_texts)))):
+                                            #print(f"But wait: Not all the operation's operands are going to be deleted! The operation must be changed, not deleted.")
+                                            operation.scheduled_change = Change()
+                                # reset text gathering metadata for next match
+                                match = None
+                                last_position = None
+                                first_operation = None
+                                first_operand_index = None
+                            else:
+                                # match exists, but the current operand does not reach the end
+                                # quit looking here and get more text
+                                break
+                        if (next_match_index < len(matches)):
+                            first_position, next_last_position = spans[next_match_index]
+                            if (position >= first_position):
+                                match = matches[next_match_index]
+                                last_position = next_last_position
+                                next_match_index += 1
+                                # newlines do not actually occur in the PDF. they have been added by us for visual representation. they must be removed here
+                                prefix = plain_text[:match.start(0)-previous_length].strip("\n")
+                                # one operand might contain multiple matches. since we are focussing on the current match, we must re-do the search and replace in the prefix
+                                prefix = rules.sub(prefix) if rules.replacing else prefix
+                                first_operation = operation
+                                first_operand_index = operand_index
+                            else:
+                                # match exists, but the current operand does not reach the start
+                                # quit looking here and get more text
+                                break
+                    position += 1
+                if (operation.operator in ["TJ", "Tj"] and first_operation is not None and operand_index not in operation.operand_changes):
+                    # delete operands containing replaced text
+                    operation.operand_changes[operand_index] = Delete()
+        if (first_operation is not None and operation.scheduled_change is None):
             # the match spans multiple operations
             # the current operation (might be Tf or something else entirely) did not contain any text and must be removed to avoid confusion
             operation.scheduled_change = Delete()
-        if (isinstance(getattr(operation, "scheduled_change", None), Delete) and operation.operator == "Td"):
+        if (isinstance(operation.scheduled_change, Delete) and operation.operator == "Td"):
             # Td movement operations should not be deleted, but rather grouped together and moved behind the replacement
             operation.scheduled_change = Cluster()
 
@@ -86,81 +140,92 @@ def schedule_deletion(operations):
     
     Useful for redacting a document entirely while maintaining design."""
     for operation in operations:
-        if (operation.operator in ["TJ", "Tj", "Td", "Tf"]):
+        if (operation is not None and operation.operator in ["TJ", "Tj", "Td", "Tf"]):
             operation.scheduled_change = Delete()
 
-def replace_text(content, context:Context, args_search, args_replace, args_delete, args_indexes, append_to_tree_list):
+def apply_changes(operations, low_level_operations):
+    """Build the new list of low-level operations in one pass."""
+    # Td operations scheduled for clustering are deferred until the next Td operation which remains
+    batch = Batch(key=lambda element: element[1])
+    for operation, element in zip(operations, low_level_operations):
+        if (operation is not None and operation.scheduled_change):
+            operation.scheduled_change.collect(batch, element, operation)
+        else:
+            batch.append(element)
+    return batch.elements
+
+def replace_text(content, context:Context, rules:RuleSet, args_delete, args_indexes, append_to_tree_list, remember_text=None, stats:Stats=NULL_STATS):
+    # parse the content stream into plain operations
+    with stats.stage("parse"):
+        low_level_operations = content.operations
+    stats.count("operations", len(low_level_operations))
+
     # transform plain operations to high-level objects
-    operations = [PDFOperation.from_tuple(operands, operator, context) for operands, operator in content.operations]
+    with stats.stage("operations"):
+        operations = [PDFOperation.from_tuple(operands, operator, context) for operands, operator in low_level_operations]
     
     # flatten mappings into one plain text string
-    text = extract_text(operations)
+    with stats.stage("extract_text"):
+        offset_map = extract_text(operations)
+    stats.count("text_operands", len(offset_map.ends))
+    text = offset_map.text
+    if (remember_text):
+        remember_text(offset_map)
 
     matches = []
-    if (args_search is None and not args_delete):
-        # just print
-        print("# These are the lines this tool might be able to handle:")
-        print(text)
-    if (args_search):
-        # search in text
-        matcher = re.compile(args_search)
-        matches = list(matcher.finditer(text))
+    if (rules is None and not args_delete):
+        # just list
+        logger.info("# These are the lines this tool might be able to handle:")
+        logger.info(text)
+    if (rules):
+        # search in text – all rules at once
+        with stats.stage("match"):
+            matches = list(rules.pattern.finditer(text))
 
     if args_indexes is not None:
         matches = [m for i,m in enumerate(matches) if i in args_indexes]
 
-    if (args_search is not None and args_delete is False):
-        # look up which operations contributed to each match and schedule to replace them
-        schedule_replacements(operations, matches, args_replace)
-        schedule_font_switches(operations, context)
-    if (args_delete):
-        schedule_deletion(operations)
+    with stats.stage("schedule"):
+        if (rules is not None and args_delete is False):
+            # look up which operations contributed to each match and schedule to replace them
+            schedule_replacements(operations, content.operations, matches, rules, offset_map)
+            schedule_font_switches(operations, context)
+        if (args_delete):
+            schedule_deletion(operations)
     
     # visualize content stream structure and scheduled changes
     if (append_to_tree_list):
         append_to_tree_list(operations)
 
-    if (args_replace is not None or args_delete is True):
-        # do the replacements, but working backwards – else the indices would no longer match
-        # we iterate over the list of high-level operations, but we modify the pypdf low-level operations
-        for operation_index, operation in reversed(list(enumerate(operations))):
-            operation_change = getattr(operation, "scheduled_change", None)
-            if (operation_change):
-                operation_change.apply(index=operation_index, collection=content.operations)
-                if (isinstance(operation_change, Delete)):
-                    #print(f"Deleted: {operation}")
-                    pass
-                elif (isinstance(operation_change, Cluster)):
-                    #print(f"Moving together: {operation}")
-                    pass
-                else:
-                    #print(f"Before replacements: {operation}")
-                    for operand_index, operand in reversed(list(enumerate(operation.get_relevant_operands()))):
-                        operand_change = getattr(operand, "scheduled_change", None)
-                        if (operand_change):
-                            operand_change.apply(operation, operand_index, operation.get_relevant_operands())
-                    #print(f"After replacements:  {operation}")
+    if ((rules is not None and rules.replacing) or args_delete is True):
+        # do the replacements – we iterate over the list of high-level operations, but we rebuild the pypdf low-level operations
+        with stats.stage("apply"):
+            if (isinstance(content, (TextObjectStream, PageContents))):
+                content.mark_changed(operations)
+            content.operations = apply_changes(operations, content.operations)
     #print(content.operations)
-    return len(matches) # return amount of matches – which is hopefully the amount of replacements (mind the postfixes!)
+    return matches # the amount of matches is hopefully the amount of replacements (mind the postfixes!)
 
 def schedule_font_switches(operations, context:Context):
     for operation in operations:
-        operation_change = getattr(operation, "scheduled_change", None)
+        if (not isinstance(operation, PDFTextOperation)):
+            continue
+        operation_change = operation.scheduled_change
         if (operation_change):
-            for operand in operation.get_relevant_operands():
-                operand_change = getattr(operand, "scheduled_change", None)
+            for operand_index in range(len(operation.plain_texts)):
+                operand_change = operation.operand_changes.get(operand_index)
                 if (operand_change and isinstance(operand_change, Text)):
-                    font_codec = operation.context.get_font_codec()
+                    font_codec = operation.get_font_codec()
                     missing_glyphs = font_codec.check_glyph_availability(operand_change.text)
                     if (missing_glyphs):
                         font_name = font_codec.font.name
-                        print(f"Set of replacement glyphs missing in font {font_name}: {missing_glyphs}")
+                        logger.warning(f"Set of replacement glyphs missing in font {font_name}: {missing_glyphs}", extra={"font_name": font_name, "missing_glyphs": missing_glyphs, "plain": True})
                         font_postscript_name = font_name.split('+')[-1] # the name without the subsetting prefix
-                        font_tuple = operation.context.inject_truetype(font_postscript_name)
+                        font_tuple = context.inject_truetype(font_postscript_name, operation.font.size)
                         operation.scheduled_change = Surround(
                             (font_tuple, b'Tf'),
                             operation_change,
-                            ((operation.context.font_key, operation.context.font_size), b'Tf')
+                            ((operation.font.key, operation.font.size), b'Tf')
                         ) # this will switch to the injected font for this one operand and then switches back
             if (isinstance(operation.scheduled_change, Surround)):
                 # schedule operands to be re-encoded for the new font
@@ -169,7 +234,7 @@ def schedule_font_switches(operations, context:Context):
                 # splitting the TJ operation into surrounded Tj operations would be more elegant,
                 # but with other changes, clusterings and deletions also being necessary in virtually any non-trivial cases,
                 # re-encoding all remaining operands is easier to implement
-                for operand in operation.get_relevant_operands():
-                    if (hasattr(operand, "plain_text") and not hasattr(operand, "scheduled_change")):
-                        operand.scheduled_change = Text(operand.plain_text)
-                operation.context.font_key = font_tuple[0] # set the font that will be switched to in the context so Text.apply → PDFOperation.set_operand_text will know what font to target
+                for operand_index, plain_text in enumerate(operation.plain_texts):
+                    if (plain_text is not None and operand_index not in operation.operand_changes):
+                        operation.operand_changes[operand_index] = Text(plain_text)
+                operation.font = FontState(font_tuple[0], operation.font.size) # set the font that will be switched to so Text.collect → PDFOperation.encode_operand_text will know what font to target
\ No newline at end of file
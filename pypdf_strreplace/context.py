@@ -1,69 +1,137 @@
-from pypdf.generic import DictionaryObject, NameObject, NumberObject, ArrayObject
-from typing import Dict, cast
+from pypdf.generic import DictionaryObject, NameObject, NumberObject, ArrayObject, IndirectObject
+from typing import Dict, NamedTuple, cast
+from io import BytesIO
+import hashlib
 from .codec import FontCodec, WinAnsiFontCodec
+from pypdf import PdfWriter
 from pypdf._font import Font
 from pypdf.constants import PageAttributes, Resources
+import logging
+
+logger = logging.getLogger(__name__)
+
+class FontState(NamedTuple):
+    """The font selected by the most recent Tf operation. Shared by all operations set in this font."""
+    key: NameObject
+    size: NumberObject
 
 class Context:
-    def __init__(self, font_codecs:Dict[str,FontCodec], fonts_dict, font_repository):
-        self.font_key = None
-        self.font_size = None
+    def __init__(self, font_codecs:Dict[str,FontCodec], fonts_dict, font_repository, font_codec_registry:"FontCodecRegistry"=None, pdf=None):
+        self.font = None # type: FontState
         self.font_codecs = font_codecs
         self.fonts_dict = fonts_dict
         self.font_repository = font_repository
-    def get_font_codec(self) -> FontCodec:
-        return self.font_codecs[self.font_key]
-    def clone_shared_font_codecs(self):
-        obj = type(self)(self.font_codecs, self.fonts_dict, self.font_repository)
-        obj.font_key = self.font_key
-        obj.font_size = self.font_size
-        return obj
-    def inject_truetype(self, postscript_name):
-        font_name = "/"+postscript_name
+        self.font_codec_registry = font_codec_registry # keeps injected fonts for the whole document
+        self.pdf = pdf # the document injected fonts are added to
+        self.font_keys = None # type: Dict[str, NameObject] base font → key in fonts_dict, built on the first injection
+        self.font_number = 0 # the highest number of a key like /F1
+    def get_font_codec(self, font:FontState=None) -> FontCodec:
+        font = font or self.font
+        return self.font_codecs[font.key if font else None]
+    def index_fonts_dict(self):
+        self.font_keys = {}
         for key, font in self.fonts_dict.items():
-            if (font["/BaseFont"] == font_name):
-                return (key, self.font_size)
-        prefix = "/F"
-        def int_or_zero(s):
+            self.font_keys.setdefault(font.get_object().get("/BaseFont"), key)
             try:
-                return int(s.lstrip("/F"))
+                self.font_number = max(self.font_number, int(key.lstrip("/F")))
             except ValueError:
-                return 0
-        max_font_number = max([int_or_zero(key) for key in self.fonts_dict.keys()])
-        font_key = NameObject(prefix+str(max_font_number+1))
-        font_dict = DictionaryObject()
-        font_dict[NameObject("/Type")] = NameObject("/Font")
-        font_dict[NameObject("/Subtype")] = NameObject("/TrueType")
-        font_dict[NameObject("/BaseFont")] = NameObject(font_name)
-        font_dict[NameObject('/Encoding')] = NameObject('/WinAnsiEncoding')
-        widths = None
-        if (self.font_repository):
-            widths = self.font_repository.get_widths(postscript_name)
-        if (widths):
-            font_dict[NameObject('/Widths')] = ArrayObject([NumberObject(width) for width in widths])
-            # these describe the range of the Widths array in respect to the entire WinAnsiEncoding
-            font_dict[NameObject('/FirstChar')] = NumberObject(0)
-            font_dict[NameObject('/LastChar')] = NumberObject(255)
-        else:
-            print(f"WARNING: Font „{postscript_name}“ has not been loaded. Horizontal spacing is likely to be inaccurate.")
-        self.fonts_dict[font_key] = font_dict
+                pass
+    def inject_truetype(self, postscript_name, font_size):
+        font_name = "/"+postscript_name
+        if (self.font_keys is None):
+            self.index_fonts_dict()
+        if (font_name in self.font_keys):
+            return (self.font_keys[font_name], font_size)
+        self.font_number += 1
+        font_key = NameObject("/F"+str(self.font_number))
+        font = self.font_codec_registry.injected_fonts.get(font_name) if self.font_codec_registry else None
+        if (font is None):
+            font = create_truetype_font(postscript_name, self.font_repository)
+            if (self.font_codec_registry):
+                font = self.font_codec_registry.share_injected_font(font, self.pdf)
+        elif ("/Widths" not in font.get_object()):
+            logger.warning(f"Font „{postscript_name}“ has not been loaded. Horizontal spacing is likely to be inaccurate.")
+        self.fonts_dict[font_key] = font
+        self.font_keys[font_name] = font_key
         self.font_codecs[font_key] = WinAnsiFontCodec(None)
-        print(f"WARNING: Font „{postscript_name}“ must be available to the renderer for truthful presentation.")
-        return (font_key, self.font_size)
+        logger.warning(f"Font „{postscript_name}“ must be available to the renderer for truthful presentation.")
+        return (font_key, font_size)
 
-def get_fonts_dict(page) -> DictionaryObject:
+def create_truetype_font(postscript_name:str, font_repository) -> DictionaryObject:
+    """Create the dictionary of a TrueType font which is referenced, not embedded."""
+    font_dict = DictionaryObject()
+    font_dict[NameObject("/Type")] = NameObject("/Font")
+    font_dict[NameObject("/Subtype")] = NameObject("/TrueType")
+    font_dict[NameObject("/BaseFont")] = NameObject("/"+postscript_name)
+    font_dict[NameObject('/Encoding')] = NameObject('/WinAnsiEncoding')
+    widths = None
+    if (font_repository):
+        widths = font_repository.get_widths(postscript_name)
+    if (widths):
+        font_dict[NameObject('/Widths')] = ArrayObject([NumberObject(width) for width in widths])
+        # these describe the range of the Widths array in respect to the entire WinAnsiEncoding
+        font_dict[NameObject('/FirstChar')] = NumberObject(0)
+        font_dict[NameObject('/LastChar')] = NumberObject(255)
+    else:
+        logger.warning(f"Font „{postscript_name}“ has not been loaded. Horizontal spacing is likely to be inaccurate.")
+    return font_dict
+
+def get_resources_dict(page) -> DictionaryObject:
     object_with_resources = page
     while NameObject(PageAttributes.RESOURCES) not in object_with_resources:
         # /Resources can be inherited so we look to parents
         object_with_resources = object_with_resources[PageAttributes.PARENT].get_object()
-    resources_dict = cast(DictionaryObject, object_with_resources[PageAttributes.RESOURCES])
+    return cast(DictionaryObject, object_with_resources[PageAttributes.RESOURCES])
+
+def get_fonts_dict(page) -> DictionaryObject:
+    resources_dict = get_resources_dict(page)
     if Resources.FONT in resources_dict:
         return cast(DictionaryObject, resources_dict[Resources.FONT])
     raise RuntimeError("This tool was not tested on PDF documents without any fonts.")
 
-def get_font_codecs(fonts_dict) -> Dict[str, FontCodec]:
+class FontCodecRegistry:
+    """Document-wide cache of font codecs, so each font object is resolved only once."""
+    def __init__(self):
+        self.font_codecs = {}
+        self.resolved = 0
+        self.hits = 0
+        self.injected_fonts = {} # type: Dict[str, object] base font → font injected into the document
+    def __str__(self):
+        return f"Resolved {self.resolved} fonts, served {self.hits} lookups from cache."
+    @staticmethod
+    def get_key(font_reference):
+        if (isinstance(font_reference, IndirectObject)):
+            return (font_reference.idnum, font_reference.generation)
+        stream = BytesIO()
+        font_reference.write_to_stream(stream)
+        return hashlib.sha256(stream.getvalue()).digest()
+    def get_font_codec(self, font_reference) -> FontCodec:
+        key = self.get_key(font_reference)
+        font_codec = self.font_codecs.get(key)
+        if (font_codec is None):
+            font_dict = DictionaryObject(cast(DictionaryObject, font_reference.get_object()))
+            if ("/DescendantFonts" in font_dict):
+                # pypdf resolves the descendant fonts in place. work on a copy so the document stays untouched.
+                font_dict[NameObject("/DescendantFonts")] = ArrayObject(font_dict["/DescendantFonts"])
+            font_codec = FontCodec.from_font(Font.from_font_resource(font_dict))
+            self.font_codecs[key] = font_codec
+            self.resolved += 1
+        else:
+            self.hits += 1
+        return font_codec
+
+    def share_injected_font(self, font_dict:DictionaryObject, pdf=None):
+        """Return the font to reference for an injected font dictionary. The first one of each name is shared by the whole document."""
+        font_name = font_dict["/BaseFont"]
+        font = self.injected_fonts.get(font_name)
+        if (font is None):
+            font = self.injected_fonts[font_name] = pdf._add_object(font_dict) if isinstance(pdf, PdfWriter) else font_dict
+        return font
+
+def get_font_codecs(fonts_dict, registry:FontCodecRegistry=None) -> Dict[str, FontCodec]:
+    if (registry is None):
+        registry = FontCodecRegistry()
     font_codecs = {}
     for font_id in fonts_dict:
-        font_dict = cast(DictionaryObject, fonts_dict[font_id].get_object())
-        font_codecs[font_id] = FontCodec.from_font(Font.from_font_resource(font_dict))
-    return font_codecs
\ No newline at end of file
+        font_codecs[font_id] = registry.get_font_codec(fonts_dict.raw_get(font_id))
+    return font_codecs
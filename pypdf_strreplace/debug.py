@@ -1,4 +1,4 @@
-from .operations import PDFOperation
+from .operations import PDFTextOperation
 
 def initialize():
     import wx
@@ -16,15 +16,17 @@ def initialize():
 def append_to_tree_list(operations, tree_list):
     root = tree_list.GetRootItem()
     for operation in operations:
-        if (operation.__class__ == PDFOperation):
+        if (operation is None or operation.operator not in ["Tf", "Td", "Tj", "TJ"]):
             continue # only show operations relevant to text processing
         operation_node = tree_list.AppendItem(root, operation.operator)
-        tree_list.SetItemText(operation_node, 3, str(getattr(operation, "scheduled_change", "")))
-        for operand in operation.get_relevant_operands():
+        tree_list.SetItemText(operation_node, 3, str(operation.scheduled_change or ""))
+        is_text_operation = isinstance(operation, PDFTextOperation)
+        for operand_index, operand in enumerate(operation.get_relevant_operands()):
             operand_node = tree_list.AppendItem(operation_node, str(operand))
             tree_list.SetItemText(operand_node, 1, str(type(operand).__name__))
-            tree_list.SetItemText(operand_node, 2, getattr(operand, "plain_text", "").replace(" ","␣").replace("\n","↲")) # might also consider ␊ for visualising line breaks
-            tree_list.SetItemText(operand_node, 3, str(getattr(operand, "scheduled_change", "")))
+            if (is_text_operation):
+                tree_list.SetItemText(operand_node, 2, (operation.plain_texts[operand_index] or "").replace(" ","␣").replace("\n","↲")) # might also consider ␊ for visualising line breaks
+                tree_list.SetItemText(operand_node, 3, str(operation.operand_changes.get(operand_index, "")))
         if (operation.operator in ["Td", "Tj", "TJ"]): # only expand operators relevant to text
             tree_list.Expand(operation_node)
             tree_list.Expand(operand_node)
\ No newline at end of file
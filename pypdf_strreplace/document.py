@@ -0,0 +1,485 @@
+import re
+import signal
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from typing import List, Tuple
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, ContentStream, DictionaryObject, EncodedStreamObject, IndirectObject, NameObject, StreamObject
+from .context import Context, FontCodecRegistry, get_fonts_dict, get_font_codecs, get_resources_dict
+from .content import extract_content_text, replace_text
+from .rules import RuleSet
+from .prefilter import Prefilter, get_content_data
+from .stats import Stats, NULL_STATS
+from .textobjects import TextObjectStream
+from .pagecontents import PageContents
+import logging
+
+logger = logging.getLogger(__name__)
+
+def get_content_streams(page) -> list:
+    contents = page.get("/Contents")
+    if (contents is None):
+        return []
+    contents = contents.get_object()
+    if (isinstance(contents, ArrayObject)):
+        return [content.get_object() for content in contents]
+    return [contents]
+
+def get_content_stream_keys(page) -> list:
+    """Identify the streams of a page with several content streams. Empty for a page with one stream."""
+    contents = page.get("/Contents")
+    if (contents is None or not isinstance(contents.get_object(), ArrayObject) or len(contents.get_object()) < 2):
+        return []
+    return [get_object_key(reference) for reference in contents.get_object()]
+
+def replace_content_streams(page, stream_data:List[bytes]):
+    """Replace the streams of a page with several content streams which have new data. The others are left as they are."""
+    writer = page.indirect_reference.pdf
+    references = page["/Contents"]
+    for index, data in enumerate(stream_data):
+        if (data is None):
+            continue
+        content = ContentStream(None, writer)
+        content.set_data(data)
+        if (isinstance(references[index], IndirectObject)):
+            writer._replace_object(references[index], content)
+        else:
+            references[index] = writer._add_object(content)
+
+def write_contents(page, contents):
+    """Write the contents returned by process_page back to page."""
+    if (isinstance(contents, PageContents)):
+        replace_content_streams(page, contents.get_stream_data())
+    else:
+        page.replace_contents(contents)
+
+def release_decoded_data(streams):
+    """Forget the decoded data pypdf keeps along with encoded streams. It is decoded again if needed."""
+    for stream in streams:
+        if (getattr(stream, "decoded_self", None) is not None):
+            stream.decoded_self = None
+
+def get_object_key(reference):
+    """Identify an object which may be shared by several pages."""
+    if (isinstance(reference, IndirectObject)):
+        return (reference.idnum, reference.generation)
+    if (isinstance(reference, ArrayObject)):
+        return tuple(get_object_key(item) for item in reference)
+    return id(reference)
+
+def set_stream_data(stream, data:bytes):
+    """Replace the decoded data of a stream object (a form XObject). It is stored without filter, compress_content_streams deflates it."""
+    if (stream.indirect_reference is None):
+        stream.pop(NameObject("/Filter"), None)
+        stream.pop(NameObject("/DecodeParms"), None)
+        stream.decoded_self = None
+        stream._data = data
+        return
+    # a ContentStream marks the form as modified, like the content streams of pages
+    writer = stream.indirect_reference.pdf
+    content = ContentStream(None, writer)
+    content.update({key: value for key, value in stream.items() if key not in ("/Filter", "/DecodeParms", "/Length")})
+    content.set_data(data)
+    writer._replace_object(stream.indirect_reference, content)
+
+def walk_form_xobjects(resources:DictionaryObject, fonts_dict:DictionaryObject, forms:set):
+    """Yield name, key, form and fonts dict of each form XObject in resources (recursively) which is not in forms yet, adding it to forms."""
+    xobjects = resources.get("/XObject") if resources is not None else None
+    if (xobjects is None):
+        return
+    xobjects = xobjects.get_object()
+    for name in xobjects:
+        reference = xobjects.raw_get(name)
+        form = reference.get_object()
+        if (form.get("/Subtype") != "/Form"):
+            continue
+        key = get_object_key(reference)
+        if (key in forms):
+            continue
+        forms.add(key)
+        form_resources = form.get("/Resources")
+        form_fonts_dict = fonts_dict
+        if (form_resources is not None and "/Font" in form_resources):
+            form_fonts_dict = form_resources["/Font"]
+        yield name, key, form, form_fonts_dict
+        if (form_resources is not None):
+            yield from walk_form_xobjects(form_resources, form_fonts_dict, forms)
+
+def process_forms(page, rules:RuleSet, args_delete:bool, args_indexes:List[int], font_codec_registry:FontCodecRegistry, font_repository, prefilter:Prefilter, forms:set, stats:Stats=NULL_STATS, text_only:bool=False) -> list:
+    """Search and replace text in the form XObjects of page not processed yet. Forms are modified in place. Returns the matches."""
+    matches = []
+    resources = get_resources_dict(page)
+    for name, key, form, fonts_dict in walk_form_xobjects(resources, resources.get("/Font"), forms):
+        if (fonts_dict is None):
+            continue # no text without fonts
+        with stats.stage("fonts"):
+            font_codecs = get_font_codecs(fonts_dict, font_codec_registry)
+        if (rules is None):
+            logger.info(f"# These fonts are referenced by form {name}: {', '.join([fc.font.name for fc in font_codecs.values()])}")
+        with stats.stage("prefilter"):
+            may_match = not prefilter.enabled or prefilter.may_match(form.get_data(), font_codecs)
+        if (not may_match):
+            continue
+        contents = TextObjectStream(form.get_data()) if text_only else ContentStream(form, page.pdf)
+        form_matches = replace_text(contents, Context(font_codecs, fonts_dict, font_repository, font_codec_registry, page.indirect_reference.pdf), rules, args_delete, args_indexes, None, stats=stats)
+        if (form_matches or args_delete):
+            set_stream_data(form, contents.get_data())
+        matches += form_matches
+    return matches
+
+def process_page(page, page_index:int, rules:RuleSet, args_delete:bool, args_indexes:List[int], font_codec_registry:FontCodecRegistry, font_repository, prefilter:Prefilter, append_to_tree_list=None, streaming:bool=False, text_index=None, forms:set=None, stats:Stats=NULL_STATS, text_only:bool=False) -> Tuple[list, object]:
+    """Search and replace text on one page and (with forms) the form XObjects it shows first. Returns the matches and the contents to write back (or None)."""
+    if (streaming):
+        streams = get_content_streams(page)
+        try:
+            matches, contents = process_page(page, page_index, rules, args_delete, args_indexes, font_codec_registry, font_repository, prefilter, append_to_tree_list, text_index=text_index, forms=forms, stats=stats, text_only=text_only)
+            if (isinstance(contents, PageContents)):
+                contents.get_stream_data() # drops the parsed operations
+            elif (contents is not None):
+                contents.set_data(contents.get_data()) # drops the parsed operations
+            return matches, contents
+        finally:
+            release_decoded_data(streams)
+    matches, contents = [], None
+    contents_key = get_object_key(page.raw_get("/Contents")) if "/Contents" in page else None
+    if (forms is None or contents_key is None or contents_key not in forms):
+        frozen = None
+        if (forms is not None and contents_key is not None):
+            forms.add(contents_key)
+            stream_keys = get_content_stream_keys(page)
+            frozen = [key in forms for key in stream_keys]
+            forms.update(stream_keys)
+        matches, contents = process_page_contents(page, page_index, rules, args_delete, args_indexes, font_codec_registry, font_repository, prefilter, append_to_tree_list, text_index, stats, text_only, frozen)
+    if (forms is not None):
+        matches = matches + process_forms(page, rules, args_delete, args_indexes, font_codec_registry, font_repository, prefilter, forms, stats, text_only)
+    return matches, contents
+
+def process_page_contents(page, page_index:int, rules:RuleSet, args_delete:bool, args_indexes:List[int], font_codec_registry:FontCodecRegistry, font_repository, prefilter:Prefilter, append_to_tree_list, text_index, stats:Stats=NULL_STATS, text_only:bool=False, frozen:List[bool]=None) -> Tuple[list, object]:
+    """Search and replace text in the content streams of page as one. Frozen streams belong to an earlier page."""
+    fonts_dict = get_fonts_dict(page)
+    with stats.stage("fonts"):
+        font_codecs = get_font_codecs(fonts_dict, font_codec_registry)
+    if (rules is None):
+        logger.info(f"# These fonts are referenced on page {page_index+1}: {', '.join([fc.font.name for fc in font_codecs.values()])}")
+    remember_text = None
+    if (text_index is not None and not args_delete):
+        key = text_index.get_key(get_content_data(page), fonts_dict)
+        text_index.record_page(page_index, key)
+        offset_map = text_index.lookup(key)
+        if (offset_map is None):
+            remember_text = lambda offset_map: text_index.store(key, offset_map)
+        elif (rules is None):
+            logger.info("# These are the lines this tool might be able to handle:")
+            logger.info(offset_map.text)
+            return [], None
+        else:
+            matches = list(rules.pattern.finditer(offset_map.text))
+            if (args_indexes is not None):
+                matches = [m for i,m in enumerate(matches) if i in args_indexes]
+            if (not matches):
+                # the index knows there is nothing to do on this page
+                text_index.skipped += 1
+                stats.count("skipped")
+                return [], None
+    with stats.stage("prefilter"):
+        may_match = not prefilter.enabled or prefilter.may_match(get_content_data(page), font_codecs)
+    if (not may_match):
+        # the needles cannot be on this page. do not bother parsing it.
+        prefilter.skipped += 1
+        stats.count("skipped")
+        return [], None
+    matches = []
+    context = Context(font_codecs, fonts_dict, font_repository, font_codec_registry, page.indirect_reference.pdf)
+    streams = get_content_streams(page)
+    if (len(streams) > 1):
+        frozen = frozen or [False]*len(streams)
+        if (all(frozen)):
+            return [], None
+        with stats.stage("parse"):
+            contents = PageContents(streams, frozen, text_only)
+        if (any(frozen)):
+            remember_text = None # the text of the frozen streams is missing
+        matches = replace_text(contents, context, rules, args_delete, args_indexes, append_to_tree_list, remember_text, stats)
+        return matches, contents if (matches or args_delete) else None
+    contents = page.get_contents()
+    if (isinstance(contents, ContentStream) and text_only):
+        text_objects = TextObjectStream(contents.get_data())
+        matches += replace_text(text_objects, context, rules, args_delete, args_indexes, append_to_tree_list, remember_text, stats)
+        if (matches or args_delete):
+            contents.set_data(text_objects.get_data())
+    elif (isinstance(contents, ContentStream)):
+        matches += replace_text(contents, context, rules, args_delete, args_indexes, append_to_tree_list, remember_text, stats)
+    else:
+        raise NotImplementedError(f"Handling content of type {type(contents)} is not implemented.")
+    if (not matches and not args_delete):
+        # leave the page as it is. the stream would only be re-serialized.
+        return matches, None
+    return matches, contents
+
+def compress_content_streams(pages, level:int=6, untouched:bool=False, jobs:int=1) -> int:
+    """Deflate the modified content streams and form XObjects of pages. Returns the amount of streams deflated."""
+    streams = []
+    seen = set()
+    forms = set()
+    for page in pages:
+        resources = get_resources_dict(page)
+        for stream in get_content_streams(page)+[form for _, _, form, _ in walk_form_xobjects(resources, None, forms)]:
+            if ("/Filter" in stream or id(stream) in seen):
+                continue
+            seen.add(id(stream))
+            # modified streams have been serialized again. they are ContentStream objects without a filter.
+            if (isinstance(stream, ContentStream) or untouched):
+                streams.append(stream)
+    datas = [stream.get_data() for stream in streams]
+    if (jobs > 1 and len(datas) > 1):
+        with ThreadPoolExecutor(jobs) as executor:
+            compressed = list(executor.map(zlib.compress, datas, [level]*len(datas)))
+    else:
+        compressed = [zlib.compress(data, level) for data in datas]
+    for stream, data in zip(streams, compressed):
+        encoded = EncodedStreamObject()
+        encoded.update(stream)
+        encoded[NameObject("/Filter")] = NameObject("/FlateDecode")
+        encoded._data = data
+        stream.indirect_reference.pdf._replace_object(stream.indirect_reference, encoded)
+    return len(streams)
+
+PAGE_RANGE = re.compile(r"(-?[0-9]+)(-(-?[0-9]+)?)?")
+
+def parse_page_selection(selection:str) -> List[Tuple[int, int]]:
+    """Parse a page selection like "1-2,-1" into (first, last) ranges of page numbers. Negative numbers count from the end."""
+    ranges = []
+    for part in selection.split(","):
+        match = PAGE_RANGE.fullmatch(part.strip())
+        if (match is None or int(match.group(1)) == 0 or (match.group(3) and int(match.group(3)) == 0)):
+            raise ValueError(f"Invalid page selection „{part}“. Use page numbers starting at 1 (or at -1 from the end) and ranges like 1-3.")
+        first = int(match.group(1))
+        if (match.group(2) is None):
+            last = first
+        else:
+            last = int(match.group(3)) if match.group(3) else -1
+        if ((first > 0) == (last > 0) and first > last):
+            raise ValueError(f"Invalid page selection „{part}“. The range ends before it starts.")
+        ranges.append((first, last))
+    return ranges
+
+def select_pages(ranges:List[Tuple[int, int]], page_count:int) -> List[int]:
+    """Return the indexes of the pages in ranges (all pages without ranges) in document order."""
+    if (ranges is None):
+        return list(range(page_count))
+    page_indexes = set()
+    for first, last in ranges:
+        first = first-1 if first > 0 else page_count+first
+        last = last-1 if last > 0 else page_count+last
+        page_indexes.update(range(max(first, 0), min(last, page_count-1)+1))
+    return sorted(page_indexes)
+
+class PageTimeoutError(Exception):
+    pass
+
+@contextmanager
+def time_limit(seconds:float):
+    """Raise PageTimeoutError in the block after seconds. Uses SIGALRM, so it works in the main thread only."""
+    if (not seconds):
+        yield
+        return
+    if (threading.current_thread() is not threading.main_thread()):
+        raise ValueError("A time limit can only be set in the main thread.")
+    def handler(signum, frame):
+        raise PageTimeoutError(seconds)
+    previous = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+class PageSnapshot:
+    """What processing a page changes besides its contents: keys in forms, form XObjects, fonts dicts and injected fonts. restore() undoes it."""
+    def __init__(self, page, forms:set=None, font_codec_registry:FontCodecRegistry=None):
+        self.forms = forms
+        self.form_keys = set(forms) if forms is not None else None
+        self.font_codec_registry = font_codec_registry
+        self.injected_fonts = set(font_codec_registry.injected_fonts) if font_codec_registry else None
+        resources = get_resources_dict(page)
+        fonts_dicts = [resources.get("/Font")]
+        self.form_streams = [] # type: List[Tuple[object, object, dict, bytes]] reference, form, entries and data
+        if (forms is not None):
+            for name, key, form, fonts_dict in walk_form_xobjects(resources, resources.get("/Font"), set(forms)):
+                fonts_dicts.append(fonts_dict)
+                self.form_streams.append((form.indirect_reference, form, dict(form), form._data))
+        self.fonts_dicts = [(fonts_dict, set(fonts_dict)) for fonts_dict in fonts_dicts if fonts_dict is not None]
+    def restore(self):
+        if (self.forms is not None):
+            self.forms.intersection_update(self.form_keys)
+        for reference, form, entries, data in self.form_streams:
+            if (reference is not None):
+                reference.pdf._replace_object(reference, form)
+            else:
+                form.clear()
+                form.update(entries)
+                form.decoded_self = None
+                form._data = data
+        for fonts_dict, keys in self.fonts_dicts:
+            for key in [key for key in fonts_dict if key not in keys]:
+                del fonts_dict[key]
+        if (self.font_codec_registry):
+            for font_name in [font_name for font_name in self.font_codec_registry.injected_fonts if font_name not in self.injected_fonts]:
+                font = self.font_codec_registry.injected_fonts.pop(font_name)
+                if (isinstance(font, IndirectObject)):
+                    font.pdf._objects[font.idnum-1] = None # not referenced any more
+
+def process_in_time(page_index:int, page_timeout:float, process, default=([], None), page=None, forms:set=None, font_codec_registry:FontCodecRegistry=None) -> Tuple[object, bool]:
+    """Call process within page_timeout seconds. Returns its result (default if it took too long, with its changes to page undone) and whether it took too long."""
+    snapshot = PageSnapshot(page, forms, font_codec_registry) if (page_timeout and page is not None) else None
+    try:
+        with time_limit(page_timeout):
+            return process(), False
+    except PageTimeoutError:
+        if (snapshot is not None):
+            snapshot.restore()
+        logger.warning(f"Page {page_index+1} took longer than {page_timeout} seconds. It is left as it is.")
+        return default, True
+
+def share_content_streams(reader:PdfReader, writer:PdfWriter):
+    """Share content streams among the pages of writer like they are shared in reader. Cloning copies them once per page."""
+    copies = {} # object number in reader → reference to the first copy in writer
+    def share(reader_reference, writer_reference):
+        if (not isinstance(reader_reference, IndirectObject) or not isinstance(writer_reference, IndirectObject)):
+            return writer_reference
+        copy = copies.setdefault(reader_reference.idnum, writer_reference)
+        if (copy.idnum != writer_reference.idnum):
+            writer._objects[writer_reference.idnum-1] = None # the copy of this page is not used any more
+        return copy
+    for reader_page, writer_page in zip(reader.pages, writer.pages):
+        if ("/Contents" not in reader_page or "/Contents" not in writer_page):
+            continue
+        reader_contents, writer_contents = reader_page.raw_get("/Contents"), writer_page.raw_get("/Contents")
+        if (isinstance(reader_contents, IndirectObject) and isinstance(reader_contents.get_object(), StreamObject)):
+            writer_page[NameObject("/Contents")] = share(reader_contents, writer_contents)
+            continue
+        reader_streams, writer_streams = reader_contents.get_object(), writer_contents.get_object()
+        if (isinstance(reader_streams, ArrayObject) and isinstance(writer_streams, ArrayObject) and len(reader_streams) == len(writer_streams)):
+            for index, reference in enumerate(reader_streams):
+                writer_streams[index] = share(reference, writer_streams[index])
+
+def create_writer(reader:PdfReader, incremental:bool=False) -> PdfWriter:
+    """Create the writer for the output document. An incremental one appends the modified objects only."""
+    if (incremental):
+        return PdfWriter(reader, incremental=True)
+    writer = PdfWriter(clone_from=reader)
+    share_content_streams(reader, writer)
+    return writer
+
+def process_document(writer, rules:RuleSet, args_delete:bool, args_indexes:List[int], font_codec_registry:FontCodecRegistry, font_repository, prefilter:Prefilter, append_to_tree_list=None, streaming:bool=False, text_index=None, stats:Stats=NULL_STATS, text_only:bool=False, page_timeout:float=None, page_indexes:List[int]=None) -> List[int]:
+    """Search and replace text on the pages of writer (page_indexes only, if given). Returns the amount of matches per rule."""
+    counts = [0]*len(rules.rules) if rules else []
+    forms = set()
+    for page_index in (range(len(writer.pages)) if page_indexes is None else page_indexes):
+        page = writer.pages[page_index]
+        with stats.page(page_index):
+            if (stats.enabled):
+                bytes_in = len(get_content_data(page))
+                stats.count("bytes_in", bytes_in)
+            (matches, contents), timed_out = process_in_time(page_index, page_timeout, lambda: process_page(page, page_index, rules, args_delete, args_indexes, font_codec_registry, font_repository, prefilter, append_to_tree_list, streaming, text_index, forms, stats, text_only), page=page, forms=forms, font_codec_registry=font_codec_registry)
+            if (timed_out):
+                stats.count("timed_out")
+            stats.count("matches", len(matches))
+            if (contents is not None):
+                with stats.stage("serialize"):
+                    streams = contents if isinstance(contents, ArrayObject) else [contents]
+                    stats.count("bytes_out", sum(len(stream.get_data()) for stream in streams))
+                write_contents(page, contents)
+            elif (stats.enabled):
+                stats.count("bytes_out", bytes_in)
+        if (rules):
+            counts = [a+b for a, b in zip(counts, rules.count(matches))]
+    return counts
+
+def search_page(page, page_index:int, rules:RuleSet, limit:int, font_codec_registry:FontCodecRegistry, prefilter:Prefilter, text_index, forms:set) -> Tuple[list, List[int], bool]:
+    """Search one page and the forms it shows first. Returns the matches per stream or form, the counts per rule and whether the prefilter skipped it."""
+    counts = [0]*len(rules.rules)
+    skipped = False
+    texts = [] # stream description, text and a function telling the content stream of a match (for pages with several)
+    contents_key = get_object_key(page.raw_get("/Contents")) if "/Contents" in page else None
+    stream_keys = get_content_stream_keys(page)
+    frozen = [key in forms for key in stream_keys] # streams shared with a page searched before
+    forms.update(stream_keys)
+    if ((contents_key is None or contents_key not in forms) and not (frozen and all(frozen))):
+        if (contents_key is not None):
+            forms.add(contents_key)
+        fonts_dict = get_fonts_dict(page)
+        font_codecs = get_font_codecs(fonts_dict, font_codec_registry)
+        offset_map = None
+        if (text_index is not None):
+            key = text_index.get_key(get_content_data(page), fonts_dict)
+            text_index.record_page(page_index, key)
+            if (not any(frozen)):
+                offset_map = text_index.lookup(key) # the text of the whole page
+        if (offset_map is not None):
+            texts.append(({"stream": 0}, offset_map.text, None))
+        elif (prefilter.enabled and not prefilter.may_match(get_content_data(page), font_codecs)):
+            skipped = True
+        else:
+            context = Context(font_codecs, fonts_dict, None)
+            streams = get_content_streams(page)
+            contents = PageContents(streams, frozen) if len(streams) > 1 else page.get_contents()
+            if (contents is not None):
+                offset_map = extract_content_text(contents, context)
+                if (text_index is not None and not any(frozen)):
+                    text_index.store(key, offset_map)
+                stream_of = None
+                if (isinstance(contents, PageContents)):
+                    stream_of = lambda match, contents=contents, offset_map=offset_map: contents.stream_of(offset_map.operations[offset_map.locate(match)[0]])
+                texts.append(({"stream": 0}, offset_map.text, stream_of))
+    resources = get_resources_dict(page)
+    for name, key, form, fonts_dict in walk_form_xobjects(resources, resources.get("/Font"), forms):
+        if (fonts_dict is None):
+            continue
+        font_codecs = get_font_codecs(fonts_dict, font_codec_registry)
+        if (prefilter.enabled and not prefilter.may_match(form.get_data(), font_codecs)):
+            continue
+        text = extract_content_text(ContentStream(form, page.pdf), Context(font_codecs, fonts_dict, None)).text
+        texts.append(({"xobject": name, "object": key[0] if isinstance(key, tuple) else None}, text, None))
+    streams = []
+    for description, text, stream_of in texts:
+        matches = []
+        for match in islice(rules.pattern.finditer(text), limit-sum(counts) if limit is not None else None):
+            rule_index = rules.rule_index(match)
+            counts[rule_index] += 1
+            matches.append({"start": match.start(), "end": match.end(), "text": match.group(0), "rule": rule_index})
+            if (stream_of is not None):
+                matches[-1]["content_stream"] = stream_of(match)
+        if (matches):
+            streams.append(dict(description, matches=matches))
+    return streams, counts, skipped
+
+def search_document(pages, rules:RuleSet, max_matches:int=None, font_codec_registry:FontCodecRegistry=None, prefilter:Prefilter=None, text_index=None, page_indexes:List[int]=None, page_timeout:float=None) -> dict:
+    """Search the pages without changing them. Returns a report which can be serialized as JSON."""
+    font_codec_registry = font_codec_registry or FontCodecRegistry()
+    prefilter = prefilter or Prefilter(rules)
+    counts = [0]*len(rules.rules)
+    forms = set()
+    report = {"occurrences": 0, "limit_reached": False, "pages_searched": 0, "skipped_pages": 0, "timed_out_pages": [], "pages": []}
+    for page_index in (range(len(pages)) if page_indexes is None else page_indexes):
+        if (max_matches is not None and sum(counts) >= max_matches):
+            break
+        report["pages_searched"] += 1
+        limit = max_matches-sum(counts) if max_matches is not None else None
+        (streams, page_counts, skipped), timed_out = process_in_time(page_index, page_timeout, lambda: search_page(pages[page_index], page_index, rules, limit, font_codec_registry, prefilter, text_index, forms), ([], [], False), pages[page_index], forms)
+        if (timed_out):
+            report["timed_out_pages"].append(page_index+1)
+            continue
+        counts = [a+b for a, b in zip(counts, page_counts)]
+        report["skipped_pages"] += skipped
+        if (streams):
+            report["pages"].append({"page": page_index+1, "streams": streams})
+    report["occurrences"] = sum(counts)
+    report["limit_reached"] = max_matches is not None and report["occurrences"] >= max_matches
+    if (len(rules.rules) > 1):
+        report["occurrences_per_rule"] = counts
+    return report
@@ -1,17 +1,112 @@
+import hashlib
+import os
+import sqlite3
+from array import array
+from typing import Dict, List
 from fontTools.ttLib import TTFont
 
+FONT_EXTENSIONS = (".ttf", ".otf")
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, hash BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS fonts (hash BLOB PRIMARY KEY, postscript_name TEXT NOT NULL, widths BLOB);
+"""
+
+def get_postscript_name(font:TTFont) -> str:
+    return next((name for name in font['name'].names if name.nameID == 6)).toUnicode()
+
+def get_file_hash(filename:str) -> bytes:
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
 class FontRepository():
-    def __init__(self):
-        self.fonts = {}
-    def load(self, ttf_filename):
-        font = TTFont(ttf_filename)
-        postscript_name = next((name for name in font['name'].names if name.nameID == 6)).toUnicode()
-        self.fonts[postscript_name] = font
-        return postscript_name, font
-    def get_widths(self, postscript_name):
+    """Fonts by PostScript name. Names and widths can be kept in a cache file (an SQLite database)."""
+    def __init__(self, cache_filename:str=None):
+        self.filenames = {} # type: Dict[str, str]
+        self.hashes = {} # type: Dict[str, bytes] postscript name → hash of the file (with a cache only)
+        self.fonts = {} # type: Dict[str, TTFont] fonts opened so far
+        self.widths = {} # type: Dict[str, List[int]]
+        self.cache_filename = cache_filename
+        self.connection = None
+    def __getstate__(self):
+        # for worker processes. they open fonts and the cache on their own.
+        state = self.__dict__.copy()
+        state["fonts"] = {}
+        state["connection"] = None
+        return state
+    def get_connection(self) -> sqlite3.Connection:
+        if (self.connection is None and self.cache_filename):
+            self.connection = sqlite3.connect(self.cache_filename, timeout=60) # worker processes may write at the same time
+            self.connection.executescript(CACHE_SCHEMA)
+        return self.connection
+    def get_cached_hash(self, filename:str) -> bytes:
+        path = os.path.abspath(filename)
+        stat = os.stat(filename)
+        connection = self.get_connection()
+        row = connection.execute("SELECT size, mtime, hash FROM files WHERE path = ?", (path,)).fetchone()
+        if (row is not None and row[:2] == (stat.st_size, stat.st_mtime)):
+            return row[2]
+        file_hash = get_file_hash(filename)
+        connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime, file_hash))
+        return file_hash
+    def add(self, ttf_filename:str) -> str:
+        """Index a font without loading its glyphs. Returns its PostScript name. A font added later replaces one with the same name."""
+        file_hash = None
+        postscript_name = None
+        if (self.cache_filename):
+            file_hash = self.get_cached_hash(ttf_filename)
+            row = self.connection.execute("SELECT postscript_name FROM fonts WHERE hash = ?", (file_hash,)).fetchone()
+            if (row is not None):
+                postscript_name = row[0]
+        if (postscript_name is None):
+            font = TTFont(ttf_filename, lazy=True) # reads the table directory only
+            postscript_name = get_postscript_name(font)
+            font.close()
+            if (file_hash is not None):
+                self.connection.execute("INSERT OR REPLACE INTO fonts VALUES (?, ?, NULL)", (file_hash, postscript_name))
+        self.filenames[postscript_name] = ttf_filename
+        self.fonts.pop(postscript_name, None)
+        self.widths.pop(postscript_name, None)
+        if (file_hash is not None):
+            self.hashes[postscript_name] = file_hash
+        return postscript_name
+    def add_directory(self, directory:str) -> List[str]:
+        """Index all fonts in directory (recursively). Returns their PostScript names."""
+        postscript_names = []
+        for path, _, filenames in os.walk(directory):
+            for filename in sorted(filenames):
+                if (filename.lower().endswith(FONT_EXTENSIONS)):
+                    postscript_names.append(self.add(os.path.join(path, filename)))
+        if (self.connection is not None):
+            self.connection.commit()
+        return postscript_names
+    def load(self, ttf_filename:str):
+        postscript_name = self.add(ttf_filename)
+        return postscript_name, self.get_font(postscript_name)
+    def get_font(self, postscript_name:str) -> TTFont:
         if (postscript_name not in self.fonts):
+            self.fonts[postscript_name] = TTFont(self.filenames[postscript_name], lazy=True)
+        return self.fonts[postscript_name]
+    def get_widths(self, postscript_name):
+        if (postscript_name not in self.filenames):
             return None
-        font = self.fonts[postscript_name]
+        if (postscript_name not in self.widths):
+            self.widths[postscript_name] = self.get_cached_widths(postscript_name)
+        return self.widths[postscript_name]
+    def get_cached_widths(self, postscript_name):
+        file_hash = self.hashes.get(postscript_name)
+        if (file_hash is None):
+            return self.compute_widths(postscript_name)
+        connection = self.get_connection()
+        row = connection.execute("SELECT widths FROM fonts WHERE hash = ?", (file_hash,)).fetchone()
+        if (row is not None and row[0] is not None):
+            return array("l", row[0]).tolist()
+        glyph_widths = self.compute_widths(postscript_name)
+        connection.execute("INSERT OR REPLACE INTO fonts VALUES (?, ?, ?)", (file_hash, postscript_name, array("l", glyph_widths).tobytes()))
+        connection.commit()
+        return glyph_widths
+    def compute_widths(self, postscript_name):
+        font = self.get_font(postscript_name)
         units_per_em = font['head'].unitsPerEm
         horizontal_metrics_table = font['hmtx']
         character_map = font.getBestCmap()
@@ -27,6 +122,23 @@ class FontRepository():
                 pdf_width = int(round(advance_width * 1000 / units_per_em))
                 glyph_widths[index] = pdf_width
         return glyph_widths
+    def close(self):
+        if (self.connection is not None):
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+def create_font_repository(paths:List[str], cache_filename:str=None) -> FontRepository:
+    """Index the given font files and directories."""
+    font_repository = FontRepository(cache_filename)
+    for path in paths:
+        if (os.path.isdir(path)):
+            font_repository.add_directory(path)
+        else:
+            font_repository.add(path)
+    if (font_repository.connection is not None):
+        font_repository.connection.commit()
+    return font_repository
 
 if __name__ == '__main__':
     import argparse
@@ -36,4 +148,4 @@ if __name__ == '__main__':
     font_repository = FontRepository()
     postscript_name, font = font_repository.load(args.input)
     print(postscript_name)
-    print(font_repository.get_widths(postscript_name))
\ No newline at end of file
+    print(font_repository.get_widths(postscript_name))
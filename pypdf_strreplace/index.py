@@ -0,0 +1,184 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+from io import BytesIO
+from typing import Dict, List
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from .context import Context, FontCodecRegistry, get_fonts_dict, get_font_codecs
+from .content import OffsetMap, extract_content_text, extract_text
+from .prefilter import get_content_data
+
+INDEX_VERSION = b"1" # change this whenever the extracted text changes for the same input
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS texts (key BLOB PRIMARY KEY, text TEXT NOT NULL, ends BLOB NOT NULL, operations BLOB NOT NULL, operand_indexes BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS documents (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS pages (path TEXT NOT NULL, page_index INTEGER NOT NULL, key BLOB NOT NULL, PRIMARY KEY (path, page_index));
+CREATE INDEX IF NOT EXISTS pages_by_key ON pages (key);
+"""
+
+def write_fingerprint(obj, stream, depth=0):
+    """Serialize everything about a font which affects decoding. Indirect objects are followed, embedded font programs are left out."""
+    if (depth > 16):
+        return
+    if (isinstance(obj, IndirectObject)):
+        obj = obj.get_object()
+    if (isinstance(obj, DictionaryObject)):
+        stream.write(b"<<")
+        for key in sorted(obj.keys()):
+            if (key.startswith("/FontFile") or key in ("/Length", "/Filter", "/DecodeParms", "/Parent")):
+                continue
+            stream.write(key.encode("utf-8"))
+            write_fingerprint(obj.raw_get(key), stream, depth+1)
+        stream.write(b">>")
+        if (isinstance(obj, StreamObject)):
+            stream.write(obj.get_data())
+    elif (isinstance(obj, ArrayObject)):
+        stream.write(b"[")
+        for item in obj:
+            write_fingerprint(item, stream, depth+1)
+            stream.write(b" ")
+        stream.write(b"]")
+    else:
+        obj.write_to_stream(stream)
+
+class TextIndex:
+    """On-disk index of the plain text of content streams.
+
+    Texts are stored along with their offset maps, keyed by a hash of the decompressed content stream and the fonts of the page.
+    Identical pages (e.g. in many documents of the same kind) share one entry.
+    The pages of each document refer to their entries. A document is indexed again if its size or modification time changes."""
+    def __init__(self, filename:str):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+        self.path = None # the document whose pages are being recorded
+        self.fingerprints = {} # type: Dict[object, bytes]
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+    def __str__(self):
+        return f"Found {self.hits} pages in the index, parsed {self.misses}."
+    def open_document(self, filename:str) -> bool:
+        """Start recording the pages of a document. Returns True if the document is indexed and unchanged."""
+        self.path = os.path.abspath(filename)
+        self.fingerprints = {} # object numbers are specific to each document
+        stat = os.stat(filename)
+        row = self.connection.execute("SELECT size, mtime FROM documents WHERE path = ?", (self.path,)).fetchone()
+        if (row == (stat.st_size, stat.st_mtime)):
+            return True
+        self.connection.execute("DELETE FROM pages WHERE path = ?", (self.path,))
+        self.connection.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)", (self.path, stat.st_size, stat.st_mtime))
+        return False
+    def get_font_fingerprint(self, font_reference) -> bytes:
+        key = FontCodecRegistry.get_key(font_reference)
+        if (key not in self.fingerprints):
+            stream = BytesIO()
+            write_fingerprint(font_reference, stream)
+            self.fingerprints[key] = hashlib.sha256(stream.getvalue()).digest()
+        return self.fingerprints[key]
+    def get_key(self, data:bytes, fonts_dict) -> bytes:
+        key = hashlib.sha256(INDEX_VERSION)
+        key.update(hashlib.sha256(data).digest())
+        for font_id in sorted(fonts_dict.keys()):
+            key.update(font_id.encode("utf-8"))
+            key.update(self.get_font_fingerprint(fonts_dict.raw_get(font_id)))
+        return key.digest()
+    def record_page(self, page_index:int, key:bytes):
+        if (self.path is not None):
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", (self.path, page_index, key))
+    def contains(self, key:bytes) -> bool:
+        return self.connection.execute("SELECT 1 FROM texts WHERE key = ?", (key,)).fetchone() is not None
+    def lookup(self, key:bytes) -> OffsetMap:
+        row = self.connection.execute("SELECT text, ends, operations, operand_indexes FROM texts WHERE key = ?", (key,)).fetchone()
+        if (row is None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        offset_map = OffsetMap()
+        offset_map.text = row[0]
+        offset_map.ends.frombytes(row[1])
+        offset_map.operations.frombytes(row[2])
+        offset_map.operand_indexes.frombytes(row[3])
+        return offset_map
+    def store(self, key:bytes, offset_map:OffsetMap):
+        self.connection.execute("INSERT OR REPLACE INTO texts VALUES (?, ?, ?, ?, ?)",
+            (key, offset_map.text, offset_map.ends.tobytes(), offset_map.operations.tobytes(), offset_map.operand_indexes.tobytes()))
+    def commit(self):
+        self.connection.commit()
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+    def add_document(self, filename:str) -> int:
+        """Index all pages of a document. Returns the amount of pages which needed to be parsed."""
+        if (self.open_document(filename)):
+            return 0
+        parsed = 0
+        font_codec_registry = FontCodecRegistry()
+        try:
+            for page_index, page in enumerate(PdfReader(filename).pages):
+                fonts_dict = get_fonts_dict(page)
+                key = self.get_key(get_content_data(page), fonts_dict)
+                self.record_page(page_index, key)
+                if (self.contains(key)):
+                    continue
+                context = Context(get_font_codecs(fonts_dict, font_codec_registry), fonts_dict, None)
+                contents = page.get_contents()
+                self.store(key, extract_content_text(contents, context) if contents is not None else extract_text([]))
+                parsed += 1
+        except Exception:
+            # do not remember a document which has not been indexed completely
+            self.connection.rollback()
+            raise
+        self.commit()
+        return parsed
+    def search(self, pattern) -> List[tuple]:
+        """Return the path, page index and amount of matches of all indexed pages which match pattern.
+
+        Each distinct text is searched once, no matter how many pages share it."""
+        counts = {}
+        for key, text in self.connection.execute("SELECT key, text FROM texts WHERE key IN (SELECT key FROM pages)"):
+            count = sum(1 for _ in pattern.finditer(text))
+            if (count):
+                counts[key] = count
+        results = []
+        for path, page_index, key in self.connection.execute("SELECT path, page_index, key FROM pages ORDER BY path, page_index"):
+            if (key in counts):
+                results.append((path, page_index, counts[key]))
+        return results
+
+def main():
+    from .batch import find_inputs
+    from .main import get_rules
+    from .rules import ENGINES
+    parser = argparse.ArgumentParser(description="Index the text of PDF files and search the index.")
+    parser.add_argument("--index", type=str, required=True, help="Path to the index (SQLite database).")
+    parser.add_argument("--add", type=str, nargs="+", default=[], help="PDF files or directories to index.")
+    parser.add_argument("--search", type=str, help="Regular expression to search for in the index.")
+    parser.add_argument("--literal", action="store_true", help="Search for the text given with --search as it is, not as a regular expression.")
+    parser.add_argument("--rules", type=str, help="JSON or CSV file with search rules. Cannot be combined with --search.")
+    parser.add_argument("--regex-engine", default="re", choices=ENGINES, help="re2 matches in linear time (no backreferences or lookarounds). Needs google-re2.")
+    args = parser.parse_args()
+    args.replace = None
+    rules = get_rules(parser, args)
+
+    text_index = TextIndex(args.index)
+    for path in args.add:
+        filenames = [filename for filename, _ in find_inputs(path)] if os.path.isdir(path) else [path]
+        for filename in filenames:
+            try:
+                parsed = text_index.add_document(filename)
+                print(f"Indexed {filename}, parsed {parsed} pages.")
+            except Exception as e:
+                print(f"{filename}: {type(e).__name__}: {e}")
+    if (rules):
+        total = 0
+        for path, page_index, count in text_index.search(rules.pattern):
+            print(f"{path} page {page_index+1}: {count} occurrences.")
+            total += count
+        print(f"There are {total} occurrences.")
+    text_index.close()
+
+if __name__ == "__main__":
+    main()
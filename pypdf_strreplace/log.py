@@ -0,0 +1,44 @@
+import logging
+import sys
+import threading
+from typing import List
+
+PACKAGE_LOGGER_NAME = "pypdf_strreplace"
+
+class RecordCollector(logging.Handler):
+    """Collects the records of this package emitted by the current thread.
+
+    Other threads may process other documents at the same time. Their records are not collected."""
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.thread = threading.get_ident()
+        self.records = [] # type: List[logging.LogRecord]
+    def emit(self, record):
+        if (record.thread == self.thread):
+            self.records.append(record)
+    def __enter__(self):
+        logging.getLogger(PACKAGE_LOGGER_NAME).addHandler(self)
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        logging.getLogger(PACKAGE_LOGGER_NAME).removeHandler(self)
+
+class MessageFormatter(logging.Formatter):
+    """Formats informational messages as they are. Warnings and errors are prefixed with their level unless they are marked plain."""
+    def format(self, record):
+        message = super().format(record)
+        if (record.levelno >= logging.WARNING and not getattr(record, "plain", False)):
+            return f"{record.levelname}: {message}"
+        return message
+
+def log_to_stdout(level=logging.INFO, stream=None):
+    """Print the messages of this package (to stream instead of stdout if given). This is what the command line tools do."""
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(MessageFormatter("%(message)s"))
+    logger = logging.getLogger(PACKAGE_LOGGER_NAME)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+
+def replay(records:List[logging.LogRecord]):
+    """Emit records collected elsewhere (e.g. in a worker process) as if they were emitted here."""
+    for record in records:
+        logging.getLogger(record.name).handle(record)
@@ -1,22 +1,100 @@
 import argparse
-from pypdf import PdfReader, PdfWriter
-from pypdf.generic import ArrayObject, ContentStream
-from .context import Context, get_fonts_dict, get_font_codecs
+import json
+import os
+import re
+import sys
+from pypdf import PdfReader
+from .context import FontCodecRegistry
 from .codec import MissingGlyphError
-from .content import replace_text
+from .document import compress_content_streams, create_writer, parse_page_selection, process_document, search_document, select_pages
+from .rules import ENGINES, RuleSet
+from .prefilter import Prefilter
+from .log import log_to_stdout
+from .stats import Stats, NULL_STATS
+
+def add_replacement_arguments(parser):
+    """Add the arguments which describe what to do to a document. Shared with batch mode."""
+    parser.add_argument("--search", type=str, help="Regular expression to search for.")
+    parser.add_argument("--literal", action="store_true", help="Search for the text given with --search as it is, not as a regular expression.")
+    parser.add_argument("--regex-engine", default="re", choices=ENGINES, help="re2 matches in linear time (no backreferences or lookarounds). Needs google-re2.")
+    parser.add_argument("--pages", type=str, help="Pages to process, e.g. 1-2,-1 for the first two and the last page. Negative numbers count from the end. The other pages are left as they are.")
+    parser.add_argument("--page-timeout", type=float, help="Leave a page as it is if processing it takes longer than this many seconds.")
+    parser.add_argument("--replace", type=str, help="Replacement text.")
+    parser.add_argument("--rules", type=str, help="JSON or CSV file with search and replace rules to apply in one pass. Cannot be combined with --search.")
+    parser.add_argument("--delete", action="store_true", help="Do not search. Delete all text.")
+    parser.add_argument('--compress', action='store_true', help='Also compress unmodified content streams which are stored without compression.')
+    parser.add_argument("--compression-level", type=int, default=6, choices=range(10), help="zlib level for modified content streams. 0 writes them uncompressed. Defaults to 6.")
+    parser.add_argument("--streaming", action="store_true", help="Release the parsed content of each page before processing the next one. Reports peak memory usage.")
+    parser.add_argument("--text-only", action="store_true", help="Parse only the text objects of content streams. Everything else is copied byte by byte. Faster for drawings and maps.")
+    parser.add_argument("--incremental", action="store_true", help="Append the modified objects to the original file as an incremental update instead of rewriting the whole file.")
+    parser.add_argument("--indexes", type=int, action="extend", nargs="+", help="Indexes of matches for replacement.")
+    parser.add_argument('--fonts', type=str, nargs='*', help="Font file(s) or directories of fonts to reference in case of missing glyphs.")
+    parser.add_argument("--font-cache", type=str, help="File (SQLite database) to keep the names and metrics of the fonts in, so they are read only once.")
+
+def get_rules(parser, args, replacing:bool=False) -> RuleSet:
+    """Create the rules given on the command line. When replacing, each rule of a rules file needs a replacement."""
+    if (args.rules and args.search is not None):
+        parser.error("--rules cannot be combined with --search.")
+    if (getattr(args, "page_timeout", None) is not None and args.page_timeout <= 0):
+        parser.error("--page-timeout must be positive.")
+    if (args.regex_engine == "re2"):
+        try:
+            import re2
+        except ImportError:
+            parser.error("--regex-engine re2 needs google-re2.")
+    try:
+        if (args.rules):
+            rules = RuleSet.from_file(args.rules, args.regex_engine)
+            if (replacing):
+                rules.check_replacing()
+            return rules
+        elif (args.search is not None):
+            return RuleSet.from_arguments(args.search, args.replace, not args.literal, args.regex_engine)
+    except re.error as e:
+        parser.error(f"Invalid regular expression: {e}")
+    except ValueError as e:
+        parser.error(str(e))
+    return None
+
+def get_page_selection(parser, args):
+    if (args.pages is None):
+        return None
+    try:
+        return parse_page_selection(args.pages)
+    except ValueError as e:
+        parser.error(str(e))
 
 def main():
     parser = argparse.ArgumentParser(description="Replace text in a PDF file.")
     parser.add_argument("--input", type=str, required=True, help="Path to the input PDF file.")
     parser.add_argument("--output", type=str, help="Path to the output PDF file.")
-    parser.add_argument("--search", type=str, help="Regular expression to search for.")
-    parser.add_argument("--replace", type=str, help="Replacement text.")
-    parser.add_argument("--delete", action="store_true", help="Do not search. Delete all text.")
-    parser.add_argument('--compress', action='store_true', help='Compress output.')
+    add_replacement_arguments(parser)
     parser.add_argument("--debug-ui", action="store_true", help="Show debug interface.")
-    parser.add_argument("--indexes", type=int, action="extend", nargs="+", help="Indexes of matches for replacement.")
-    parser.add_argument('--fonts', type=str, nargs='*', help="Font file(s) to load to embed in case of missing glyphs.")
+    parser.add_argument("--jobs", type=int, default=1, help="Amount of worker processes for processing pages in parallel.")
+    parser.add_argument("--count", action="store_true", help="Only search. Print a JSON report of all matches per page and content stream instead of replacing.")
+    parser.add_argument("--max-matches", type=int, help="With --count, stop searching after this amount of matches. 1 stops at the first match.")
+    parser.add_argument("--index", type=str, help="Text index (SQLite database) to look up known pages in and to add parsed pages to.")
+    parser.add_argument("--stats-json", type=str, help="Write timings per page and stage, counts and sizes to this JSON file.")
+    parser.add_argument("--profile", type=int, metavar="PAGE", help="Profile the processing of this page (1 is the first page) with cProfile.")
+    parser.add_argument("--profile-memory", action="store_true", help="With --profile, trace memory allocations with tracemalloc instead.")
+    parser.add_argument("--profile-output", type=str, help="With --profile, dump the profile (pstats file or tracemalloc snapshot) to this file instead of printing a summary.")
     args = parser.parse_args()
+    if (args.jobs < 1):
+        parser.error("--jobs must be at least 1.")
+    if (args.jobs > 1 and args.debug_ui):
+        parser.error("--jobs cannot be combined with --debug-ui.")
+    if (args.jobs > 1 and args.index):
+        parser.error("--jobs cannot be combined with --index.")
+    if ((args.stats_json or args.profile) and (args.jobs > 1 or args.count)):
+        parser.error("--stats-json and --profile cannot be combined with --jobs or --count.")
+    if (args.profile is not None and args.profile < 1):
+        parser.error("--profile needs a page number starting at 1.")
+
+    rules = get_rules(parser, args, args.output and not args.count and not args.delete)
+    page_selection = get_page_selection(parser, args)
+    if (args.count and rules is None):
+        parser.error("--count needs --search or --rules.")
+    log_to_stdout(stream=sys.stderr if args.count else None) # stdout carries the json report
 
     append_to_tree_list = None
     if (args.debug_ui):
@@ -27,42 +105,83 @@ def main():
 
     font_repository = None
     if (args.fonts):
-        from .font import FontRepository
-        font_repository = FontRepository()
-        for font_filename in args.fonts:
-            postscript_name, _ = font_repository.load(font_filename)
-            print(f"Loaded font „{postscript_name}“.")
+        from .font import create_font_repository
+        font_repository = create_font_repository(args.fonts, args.font_cache)
+        if (len(font_repository.filenames) > 10):
+            print(f"Indexed {len(font_repository.filenames)} fonts.")
+        else:
+            for postscript_name in font_repository.filenames:
+                print(f"Loaded font „{postscript_name}“.")
 
-    total_replacements = 0
     reader = PdfReader(args.input)
-    writer = PdfWriter(clone_from=reader)
+    page_indexes = select_pages(page_selection, len(reader.pages))
+    if (not page_indexes and page_selection is not None):
+        parser.error(f"--pages {args.pages} selects none of the {len(reader.pages)} pages.")
+    text_index = None
+    if (args.index):
+        from .index import TextIndex
+        text_index = TextIndex(args.index)
+        if (page_selection is None):
+            text_index.open_document(args.input) # record the pages of the document. a selection would record some of them only.
+    if (args.count):
+        # search only. no need to clone the document.
+        report = {"input": args.input}
+        report.update(search_document(reader.pages, rules, args.max_matches, text_index=text_index, page_indexes=page_indexes, page_timeout=args.page_timeout))
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if (text_index):
+            text_index.close()
+        return
+    writer = create_writer(reader, args.incremental)
+    font_codec_registry = FontCodecRegistry() # pages share the codecs of the fonts they have in common
+    prefilter = Prefilter(rules) if not args.delete else Prefilter(None)
+    stats = NULL_STATS
+    if (args.stats_json or args.profile):
+        stats = Stats(args.profile-1 if args.profile else None, args.profile_memory, args.profile_output)
     try:
-        for page_index, page in enumerate(writer.pages):
-            fonts_dict = get_fonts_dict(page)
-            font_codecs = get_font_codecs(fonts_dict)
-            if (args.search is None):
-                print(f"# These fonts are referenced on page {page_index+1}: {', '.join([fc.font.name for fc in font_codecs.values()])}")
-            context = Context(font_codecs, fonts_dict, font_repository)
-            contents = page.get_contents()
-            if (isinstance(contents, ArrayObject)):
-                for content in contents:
-                    total_replacements += replace_text(content, context, args.search, args.replace, args.delete, args.indexes, append_to_tree_list)
-            elif (isinstance(contents, ContentStream)):
-                total_replacements += replace_text(contents, context, args.search, args.replace, args.delete, args.indexes, append_to_tree_list)
-            else:
-                raise NotImplementedError(f"Handling content of type {type(contents)} is not implemented.")
-            page.replace_contents(contents)
+        if (args.jobs > 1):
+            from .parallel import replace_in_parallel
+            counts = replace_in_parallel(writer, args.input, args.jobs, rules, args.delete, args.indexes, font_codec_registry, font_repository, prefilter, args.text_only, args.page_timeout, page_indexes)
+        else:
+            counts = process_document(writer, rules, args.delete, args.indexes, font_codec_registry, font_repository, prefilter, append_to_tree_list, args.streaming, text_index, stats, args.text_only, args.page_timeout, page_indexes)
 
         if (args.output):
-            if (args.compress):
-                for page in writer.pages:
-                    page.compress_content_streams()
-            writer.write(args.output)
+            if (args.compression_level or args.compress):
+                with stats.stage("compress"):
+                    compress_content_streams([writer.pages[page_index] for page_index in page_indexes], args.compression_level, args.compress, args.jobs)
+            with stats.stage("write"):
+                writer.write(args.output)
 
-        if (args.search):
-            print(f"There are {total_replacements} occurrences.")
+        if (rules):
+            if (len(rules.rules) > 1):
+                for rule, count in zip(rules.rules, counts):
+                    print(f"Rule {rule} has {count} occurrences.")
+            if (prefilter.skipped):
+                print(f"Skipped {prefilter.skipped} pages which cannot contain any match.")
+            if (text_index and text_index.skipped):
+                print(f"Skipped {text_index.skipped} pages which contain no match according to the index.")
+            print(f"There are {sum(counts)} occurrences.")
+        else:
+            print(f"# {font_codec_registry}")
+        if (text_index):
+            print(f"# {text_index}")
+        if (stats.profile_report):
+            print(stats.profile_report)
+        if (args.stats_json):
+            report = {"input": args.input, "output": args.output, "bytes_in": os.path.getsize(args.input), "bytes_out": os.path.getsize(args.output) if args.output else None,
+                "occurrences": sum(counts), "skipped_pages": prefilter.skipped}
+            report.update(stats.to_dict(font_codec_registry))
+            with open(args.stats_json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
     except MissingGlyphError as mge:
         print(mge.args[0])
+    if (text_index):
+        text_index.close()
+    if (font_repository):
+        font_repository.close()
+
+    if (args.streaming):
+        import resource
+        print(f"Peak memory usage: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss//1024} MiB.") # Linux reports KiB
 
     if (args.debug_ui):
         frame.Show()
@@ -0,0 +1,142 @@
+from array import array
+from bisect import bisect_right
+from typing import List
+from pypdf.generic import ContentStream
+from .textobjects import GAP, TextObjectStream, find_text_segments
+
+BREAK = b"StrreplaceBreak" # operator standing for the boundary between two content streams (followed by its number). it is never written.
+
+class PageContents:
+    """All content streams of a page as one sequence of operations, so text is matched across stream boundaries."""
+    def __init__(self, streams:list, frozen:List[bool]=None, text_only:bool=False):
+        self.streams = streams
+        self.datas = [stream.get_data() for stream in streams]
+        self.units = [[index] for index in range(len(streams))] # type: List[List[int]] stream indexes
+        self.frozen_streams = frozen or [False]*len(streams)
+        self.frozen = None # type: List[bool] per unit
+        self.parts = None # type: List[TextObjectStream] with text_only, one per unit
+        self.starts = array("q")
+        self.changed = set() # indexes of operations which have been changed in place
+        self.stream_data = None # type: List[bytes]
+        self.original = self.parse_text_objects() if text_only else self.parse_operations()
+        self._operations = self.original
+    def get_unit_data(self, unit:List[int]) -> bytes:
+        return b"\n".join(self.datas[index] for index in unit)
+    def freeze_units(self):
+        self.frozen = [all(self.frozen_streams[index] for index in unit) for unit in self.units]
+    def parse_operations(self) -> List[tuple]:
+        parser = ContentStream(None, None)
+        while (True):
+            self.freeze_units()
+            parser.set_data(b"".join((b"\n%s%d\n" % (BREAK, unit_index) if unit_index else b"")+(b"" if frozen else self.get_unit_data(unit)) for unit_index, (unit, frozen) in enumerate(zip(self.units, self.frozen))))
+            parsed = parser.operations
+            breaks = {int(operator[len(BREAK):]): index for index, (operands, operator) in enumerate(parsed) if operator.startswith(BREAK)} if len(self.units) > 1 else {}
+            # an operation spanning a boundary takes the break as its operator. a string spanning it hides the break.
+            spanning = [unit_index for unit_index in range(1, len(self.units)) if unit_index not in breaks or parsed[breaks[unit_index]][0]]
+            if (not spanning):
+                break
+            for unit_index in reversed(spanning):
+                self.units[unit_index-1] += self.units.pop(unit_index)
+        operations = []
+        begin = 0
+        for unit_index, end in enumerate(sorted(breaks.values())+[len(parsed)]):
+            self.starts.append(len(operations))
+            if (self.frozen[unit_index]):
+                operations.append(([self.get_unit_data(self.units[unit_index])], GAP))
+            else:
+                operations += parsed[begin:end]
+            begin = end+1
+        return operations
+    def parse_text_objects(self) -> List[tuple]:
+        boundaries = [] # offset of each stream but the first in the data joined like pypdf does
+        position = 0
+        for data in self.datas[:-1]:
+            position += len(data)+1
+            boundaries.append(position)
+        for start, end in find_text_segments(b"\n".join(self.datas)):
+            first, last = bisect_right(boundaries, start), bisect_right(boundaries, end-1)
+            if (first != last):
+                # the text object spans streams. join their units.
+                first_unit = next(unit_index for unit_index, unit in enumerate(self.units) if first in unit)
+                while (self.units[first_unit][-1] < last):
+                    self.units[first_unit] += self.units.pop(first_unit+1)
+        self.freeze_units()
+        self.parts = []
+        operations = []
+        for unit, frozen in zip(self.units, self.frozen):
+            self.starts.append(len(operations))
+            part = TextObjectStream(self.get_unit_data(unit))
+            self.parts.append(part)
+            operations += [([part.data], GAP)] if frozen else part.operations
+        return operations
+    @property
+    def operations(self) -> List[tuple]:
+        return self._operations
+    @operations.setter
+    def operations(self, operations:List[tuple]):
+        self._operations = operations
+    def unit_of(self, operation_index:int) -> int:
+        return bisect_right(self.starts, operation_index)-1
+    def stream_of(self, operation_index:int) -> int:
+        """Return the index of the stream the original operation came from (the first stream of its unit)."""
+        return self.units[self.unit_of(operation_index)][0]
+    def mark_changed(self, operations):
+        """Remember which operations are about to be changed. Their operands may be modified in place."""
+        self.changed = {index for index, operation in enumerate(operations) if operation is not None and operation.scheduled_change}
+    def get_stream_data(self) -> List[bytes]:
+        """Return the new data of each modified stream, None for the others. The operations are released."""
+        if (self.stream_data is not None):
+            return self.stream_data
+        self.stream_data = [None]*len(self.streams)
+        if (self._operations is None or self._operations is self.original):
+            return self.stream_data
+        positions = {id(element): index for index, element in enumerate(self.original)}
+        assigned = [[] for _ in self.units]
+        touched = {self.unit_of(index) for index in self.changed}
+        kept = [0]*len(self.units)
+        pending = [] # new operations not assigned to a unit yet
+        unit_index = None
+        for element in self._operations:
+            index = positions.get(id(element))
+            if (index is None):
+                # a new operation goes with the original operation before it
+                if (unit_index is None or self.frozen[unit_index]):
+                    pending.append(element)
+                else:
+                    assigned[unit_index].append(element)
+                    touched.add(unit_index)
+                continue
+            unit_index = self.unit_of(index)
+            kept[unit_index] += 1
+            if (pending and not self.frozen[unit_index]):
+                assigned[unit_index] += pending
+                touched.add(unit_index)
+                pending = []
+            assigned[unit_index].append(element)
+        if (pending):
+            unit_index = max(index for index, frozen in enumerate(self.frozen) if not frozen)
+            assigned[unit_index] += pending
+            touched.add(unit_index)
+        ends = self.starts[1:].tolist()+[len(self.original)]
+        touched.update(index for index in range(len(self.units)) if kept[index] != ends[index]-self.starts[index])
+        for unit_index in sorted(touched):
+            if (self.frozen[unit_index]):
+                continue
+            if (self.parts is not None):
+                part = self.parts[unit_index]
+                part.operations = assigned[unit_index]
+                part.changed = {index-self.starts[unit_index] for index in self.changed if self.unit_of(index) == unit_index}
+                data = part.get_data()
+            else:
+                serializer = ContentStream(None, None)
+                serializer.operations = assigned[unit_index]
+                data = serializer.get_data()
+            first, *others = self.units[unit_index]
+            self.stream_data[first] = data
+            for index in others:
+                self.stream_data[index] = b""
+        self._operations = self.original = self.parts = None
+        return self.stream_data
+    def get_data(self) -> bytes:
+        """Return the data of all streams as pypdf concatenates them."""
+        return b"".join((data if data is not None else original)+b"\n" for original, data in zip(self.datas, self.get_stream_data()))
@@ -0,0 +1,148 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+from pypdf import PdfReader
+from pypdf.generic import ContentStream, DictionaryObject
+from .context import FontCodecRegistry, get_fonts_dict
+from .codec import MissingGlyphError
+from .document import get_content_stream_keys, get_object_key, process_forms, process_in_time, process_page, replace_content_streams, write_contents
+from .pagecontents import PageContents
+from .rules import RuleSet
+from .prefilter import Prefilter
+from .log import PACKAGE_LOGGER_NAME, RecordCollector, replay
+
+class PageResult:
+    """What a worker reports about one page. Everything in here can be pickled."""
+    def __init__(self, page_index:int):
+        self.page_index = page_index
+        self.records = [] # type: List[logging.LogRecord]
+        self.counts = [] # type: List[int]
+        self.data = None # type: bytes
+        self.stream_data = None # type: List[bytes] new data per content stream (None for unmodified ones) of a page with several
+        self.skipped = False
+        self.timed_out = False
+        self.font_keys = None # keys of the fonts dict before fonts were injected
+        self.injected_fonts = {} # type: Dict[str, DictionaryObject]
+        self.error = None # type: str
+        self.resolved = 0
+        self.hits = 0
+
+class Worker:
+    """Processes pages of the input document in a worker process.
+
+    Each page is processed against the pristine document. Fonts injected into a fonts dict are removed again,
+    so the result of a page does not depend on which other pages the same worker processed before."""
+    def __init__(self, input_filename:str, rules:RuleSet, args_delete:bool, args_indexes:List[int], font_repository, text_only:bool, log_level:int, page_timeout:float=None):
+        # messages are sent to the main process along with the page. drop handlers inherited from it.
+        logger = logging.getLogger(PACKAGE_LOGGER_NAME)
+        logger.handlers.clear()
+        logger.propagate = False
+        logger.setLevel(log_level)
+        self.reader = PdfReader(input_filename)
+        self.rules = rules
+        self.args_delete = args_delete
+        self.args_indexes = args_indexes
+        self.text_only = text_only
+        self.page_timeout = page_timeout
+        self.font_repository = font_repository # indexed in the main process. fonts are opened here when needed.
+        self.font_codec_registry = FontCodecRegistry()
+        self.prefilter = Prefilter(rules) if not args_delete else Prefilter(None)
+    def process_page(self, page_index:int) -> PageResult:
+        result = PageResult(page_index)
+        page = self.reader.pages[page_index]
+        fonts_dict = get_fonts_dict(page)
+        font_keys = list(fonts_dict.keys())
+        resolved, hits = self.font_codec_registry.resolved, self.font_codec_registry.hits
+        skipped = self.prefilter.skipped
+        with RecordCollector() as collector:
+            try:
+                (matches, contents), result.timed_out = process_in_time(page_index, self.page_timeout, lambda: process_page(page, page_index, self.rules, self.args_delete, self.args_indexes, self.font_codec_registry, self.font_repository, self.prefilter, streaming=True, text_only=self.text_only), page=page, font_codec_registry=self.font_codec_registry)
+                result.counts = self.rules.count(matches) if self.rules else []
+                if (isinstance(contents, PageContents)):
+                    result.stream_data = contents.get_stream_data()
+                elif (contents is not None):
+                    result.data = contents.get_data()
+            except MissingGlyphError as mge:
+                result.error = mge.args[0]
+            finally:
+                for key in list(fonts_dict.keys()):
+                    if (key not in font_keys):
+                        result.injected_fonts[key] = fonts_dict[key]
+                        del fonts_dict[key]
+        if (result.injected_fonts):
+            result.font_keys = font_keys
+        result.records = collector.records
+        result.skipped = self.prefilter.skipped > skipped
+        result.resolved = self.font_codec_registry.resolved-resolved
+        result.hits = self.font_codec_registry.hits-hits
+        return result
+
+worker = None # type: Worker
+
+def initialize_worker(*args):
+    global worker
+    worker = Worker(*args)
+
+def process_pages(page_indexes:List[int]) -> List[PageResult]:
+    return [worker.process_page(page_index) for page_index in page_indexes]
+
+def replace_in_parallel(writer, input_filename:str, jobs:int, rules:RuleSet, args_delete:bool, args_indexes:List[int], font_codec_registry:FontCodecRegistry, font_repository, prefilter:Prefilter, text_only:bool=False, page_timeout:float=None, page_indexes:List[int]=None) -> List[int]:
+    """Process the pages of writer in a pool of worker processes and merge the results in page order.
+
+    The workers read the input document on their own and send back the modified content streams.
+    A page which injects fonts into a fonts dict already changed by an earlier page is processed again here,
+    exactly as it would have been without workers. So is a page sharing its content stream with an earlier page.
+    Form XObjects are shared by many pages and processed here once. Returns the amount of matches per rule.
+    With page_indexes, only these pages are processed."""
+    if (page_indexes is None):
+        page_indexes = list(range(len(writer.pages)))
+    chunk_size = max(1, len(page_indexes) // (jobs*4))
+    chunks = [page_indexes[start:start+chunk_size] for start in range(0, len(page_indexes), chunk_size)]
+    counts = [0]*len(rules.rules) if rules else []
+    forms = set()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initialize_worker, initargs=(input_filename, rules, args_delete, args_indexes, font_repository, text_only, logging.getLogger(PACKAGE_LOGGER_NAME).getEffectiveLevel(), page_timeout)) as executor:
+        try:
+            for results in executor.map(process_pages, chunks):
+                for result in results:
+                    page = writer.pages[result.page_index]
+                    fonts_dict = get_fonts_dict(page)
+                    contents_key = get_object_key(page.raw_get("/Contents")) if "/Contents" in page else None
+                    stream_keys = get_content_stream_keys(page)
+                    # the worker did not know whether an earlier page shares the content stream or injected fonts into the same fonts dict
+                    if (contents_key in forms or any(key in forms for key in stream_keys) or (result.injected_fonts and list(fonts_dict.keys()) != result.font_keys)):
+                        (matches, contents), _ = process_in_time(result.page_index, page_timeout, lambda: process_page(page, result.page_index, rules, args_delete, args_indexes, font_codec_registry, font_repository, prefilter, forms=forms, text_only=text_only), page=page, forms=forms, font_codec_registry=font_codec_registry)
+                        if (contents is not None):
+                            write_contents(page, contents)
+                        counts = [a+b for a, b in zip(counts, rules.count(matches))] if rules else counts
+                        continue
+                    replay(result.records)
+                    if (result.error is not None):
+                        raise MissingGlyphError(result.error)
+                    font_codec_registry.resolved += result.resolved
+                    font_codec_registry.hits += result.hits
+                    prefilter.skipped += result.skipped
+                    if (result.timed_out):
+                        continue
+                    def merge():
+                        if (contents_key is not None):
+                            forms.add(contents_key)
+                            forms.update(stream_keys)
+                        for key, font_dict in result.injected_fonts.items():
+                            fonts_dict[key] = font_codec_registry.share_injected_font(font_dict, writer)
+                        return process_forms(page, rules, args_delete, args_indexes, font_codec_registry, font_repository, prefilter, forms, text_only=text_only)
+                    matches, timed_out = process_in_time(result.page_index, page_timeout, merge, [], page, forms, font_codec_registry)
+                    if (timed_out):
+                        continue
+                    if (result.data is not None):
+                        contents = ContentStream(None, writer)
+                        contents.set_data(result.data)
+                        page.replace_contents(contents)
+                    elif (result.stream_data is not None):
+                        replace_content_streams(page, result.stream_data)
+                    counts = [a+b for a, b in zip(counts, result.counts)]
+                    counts = [a+b for a, b in zip(counts, rules.count(matches))] if rules else counts
+        except BaseException:
+            # do not wait for pages which are not going to be used
+            executor.shutdown(cancel_futures=True)
+            raise
+    return counts
@@ -0,0 +1,134 @@
+import re
+from typing import Dict, List, Tuple
+from pypdf.generic import ArrayObject, create_string_object
+from .codec import FontCodec, MissingGlyphError
+from .rules import RuleSet
+
+# the next token which might start a string, hide one or select the font of the following strings
+TOKEN = re.compile(rb"\(|<<|<|%|/([^\s/\[\]()<>{}%]+)\s+[-+.0-9]+\s+Tf(?![^\s/\[<(])|(?<![^\s])(BI|q|Q)(?![^\s/\[<(])")
+LITERAL_STRING_SPECIAL = re.compile(rb"[()\\]")
+LITERAL_STRING_ESCAPE = re.compile(rb"\\([0-7]{1,3}|\r\n|.)", re.DOTALL)
+LITERAL_STRING_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f", b"\r\n": b"", b"\r": b"", b"\n": b""}
+LINE_END = re.compile(rb"[\r\n]")
+INLINE_IMAGE_DATA = re.compile(rb"(?<![^\s])ID\s")
+INLINE_IMAGE_END = re.compile(rb"\sEI(?![^\s])")
+WHITESPACE = re.compile(rb"\s+")
+NAME_ESCAPE = re.compile(rb"#([0-9a-fA-F]{2})")
+
+def get_content_data(page) -> bytes:
+    """Return the decompressed bytes of all content streams of page without parsing them."""
+    contents = page.get("/Contents")
+    if (contents is None):
+        return b""
+    contents = contents.get_object()
+    if (isinstance(contents, ArrayObject)):
+        return b"\n".join(content.get_object().get_data() for content in contents)
+    return contents.get_data()
+
+def unescape_literal_string(data:bytes) -> bytes:
+    def replace(match):
+        escaped = match.group(1)
+        if (escaped[:1].isdigit()):
+            return bytes([int(escaped, 8) & 0xFF])
+        return LITERAL_STRING_ESCAPES.get(escaped, escaped)
+    return LITERAL_STRING_ESCAPE.sub(replace, data)
+
+def find_literal_string_end(data:bytes, position:int) -> Tuple[int, bool]:
+    """Return the position after the parenthesis closing the literal string starting at position and whether it is terminated at all."""
+    depth = 1
+    while (depth):
+        special = LITERAL_STRING_SPECIAL.search(data, position)
+        if (special is None):
+            return len(data), False
+        position = special.end()
+        if (special.group(0) == b"\\"):
+            position += 1
+        elif (special.group(0) == b"("):
+            depth += 1
+        else:
+            depth -= 1
+    return position, True
+
+def scan_strings(data:bytes):
+    """Yield (font name, string bytes) for the literal and hexadecimal strings in a content stream."""
+    font_name = None
+    saved_font_names = [] # the font is part of the graphics state which is saved by q and restored by Q
+    position = 0
+    while (True):
+        token = TOKEN.search(data, position)
+        if (token is None):
+            break
+        kind = token.group(0)
+        position = token.end()
+        if (kind == b"("):
+            start = position
+            position, terminated = find_literal_string_end(data, position)
+            yield font_name, unescape_literal_string(data[start:position-1 if terminated else position])
+        elif (kind == b"<"):
+            end = data.find(b">", position)
+            if (end < 0):
+                end = len(data)
+            digits = WHITESPACE.sub(b"", data[position:end])
+            if (len(digits) % 2):
+                digits += b"0"
+            try:
+                yield font_name, bytes.fromhex(digits.decode("ascii"))
+            except ValueError:
+                pass
+            position = end+1
+        elif (kind == b"%"):
+            line_end = LINE_END.search(data, position)
+            position = line_end.end() if line_end else len(data)
+        elif (token.group(1) is not None):
+            font_name = "/"+NAME_ESCAPE.sub(lambda m: bytes([int(m.group(1), 16)]), token.group(1)).decode("utf-8", "replace")
+        elif (kind == b"q"):
+            saved_font_names.append(font_name)
+        elif (kind == b"Q"):
+            if (saved_font_names):
+                font_name = saved_font_names.pop()
+        elif (kind == b"BI"):
+            image_data = INLINE_IMAGE_DATA.search(data, position)
+            image_end = INLINE_IMAGE_END.search(data, image_data.end() if image_data else position)
+            position = image_end.end() if image_end else len(data)
+        # dictionaries (<<) contain nothing of interest, their contents are scanned like any other bytes
+
+class Prefilter:
+    """Tells whether a page can possibly contain a match of literal needles without parsing its content."""
+    def __init__(self, rules:RuleSet):
+        self.words = None
+        self.skipped = 0
+        if (rules is not None):
+            needles = [rule.literal for rule in rules.rules]
+            if (all(needles) and all(needle.split() for needle in needles)):
+                self.words = [needle.split() for needle in needles]
+        self.encoded_words = {} # type: Dict[FontCodec, List[bytes]]
+    @property
+    def enabled(self):
+        return self.words is not None
+    def get_encoded_words(self, font_codec:FontCodec) -> List[bytes]:
+        """Return the raw bytes of all words which can be set in this font."""
+        if (font_codec not in self.encoded_words):
+            encoded_words = []
+            for words in self.words:
+                for word in words:
+                    try:
+                        encoded_words.append(font_codec.encode_raw(word))
+                    except (MissingGlyphError, NotImplementedError, ValueError, TypeError):
+                        pass # the word cannot be set in this font – at least not in one piece
+            self.encoded_words[font_codec] = encoded_words
+        return self.encoded_words[font_codec]
+    def may_match(self, data:bytes, font_codecs:Dict[str, FontCodec]) -> bool:
+        # quick check on the raw bytes – if any word is there verbatim, the page needs to be parsed anyway
+        for font_codec in font_codecs.values():
+            if (any(encoded_word in data for encoded_word in self.get_encoded_words(font_codec))):
+                return True
+        parts = []
+        for font_name, string in scan_strings(data):
+            if (font_name not in font_codecs):
+                return True
+            try:
+                parts.append(font_codecs[font_name].decode(create_string_object(string)))
+            except (NotImplementedError, ValueError, LookupError):
+                return True
+        text = "".join(parts)
+        return any(all(word in text for word in words) for words in self.words)
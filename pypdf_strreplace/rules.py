@@ -0,0 +1,243 @@
+import re
+import csv
+import json
+from typing import List
+
+REGEX_SPECIAL_CHARACTERS = ".^$*+?{}[]\\|()"
+ENGINES = ["re", "re2"]
+GROUP_REFERENCE = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?P=|\(\?\()") # \1, (?P=name) or (?(1)…) which is not escaped
+
+def compile_pattern(pattern:str, engine:str="re"):
+    """Compile pattern with the re module or with re2 (from google-re2), which matches in linear time but knows no backreferences or lookarounds."""
+    if (engine == "re2"):
+        import re2
+        options = re2.Options()
+        options.log_errors = False # errors are raised
+        try:
+            return re2.compile(pattern, options)
+        except re2.error as e:
+            message = e.args[0] if e.args else "invalid pattern"
+            raise re.error(message.decode() if isinstance(message, bytes) else message, pattern) from None
+    return re.compile(pattern)
+
+class LiteralMatch:
+    """A match of a LiteralPattern. Offers the parts of re.Match this tool uses."""
+    __slots__ = ("string", "lastindex", "_start", "_end")
+    def __init__(self, string:str, start:int, end:int, lastindex:int):
+        self.string = string
+        self.lastindex = lastindex
+        self._start = start
+        self._end = end
+    def start(self, group=0) -> int:
+        return self._start
+    def end(self, group=0) -> int:
+        return self._end
+    def span(self, group=0):
+        return (self._start, self._end)
+    def group(self, group=0) -> str:
+        return self.string[self._start:self._end]
+
+class LiteralPattern:
+    """Searches several literal needles with str.find instead of a regular expression alternation.
+
+    Like in an alternation, the leftmost needle wins and the one listed first wins among needles found at the same position.
+    The group index (lastindex) of a match is the index of the needle plus one. Each needle is searched again
+    only when a match passes its next occurrence, so there is no backtracking."""
+    def __init__(self, needles:List[str]):
+        if (not all(needles)):
+            raise ValueError("Needles must not be empty.")
+        self.needles = needles
+        self.pattern = "|".join(re.escape(needle) for needle in needles)
+    def finditer(self, string:str, pos:int=0):
+        positions = [string.find(needle, pos) for needle in self.needles]
+        while (True):
+            best = None
+            for index, position in enumerate(positions):
+                if (position >= 0 and (best is None or position < positions[best])):
+                    best = index
+            if (best is None):
+                return
+            start = positions[best]
+            end = start+len(self.needles[best])
+            yield LiteralMatch(string, start, end, best+1)
+            for index, position in enumerate(positions):
+                if (0 <= position < end):
+                    positions[index] = string.find(self.needles[index], end)
+    def search(self, string:str, pos:int=0) -> LiteralMatch:
+        return next(self.finditer(string, pos), None)
+    def sub(self, repl, string:str) -> str:
+        parts = []
+        position = 0
+        for match in self.finditer(string):
+            parts += [string[position:match.start()], repl(match) if callable(repl) else repl]
+            position = match.end()
+        parts.append(string[position:])
+        return "".join(parts)
+
+class RuleMatch:
+    """A match of one rule found by a MultiPattern. Behaves like the rule's own match, lastindex tells the rule."""
+    __slots__ = ("match", "lastindex")
+    def __init__(self, match, lastindex:int):
+        self.match = match
+        self.lastindex = lastindex
+    def __getattr__(self, name):
+        return getattr(self.match, name)
+
+class MultiPattern:
+    """Searches several patterns one by one instead of combining them into one alternation.
+
+    For patterns which cannot be combined (e.g. because they refer to their own groups by number).
+    Like in an alternation, the leftmost match wins and the pattern listed first wins among matches at the same position.
+    Each pattern is searched again only when a match passes its next match."""
+    def __init__(self, patterns:list):
+        self.patterns = patterns
+        self.pattern = "|".join(pattern.pattern for pattern in patterns)
+    def finditer(self, string:str, pos:int=0):
+        matches = [pattern.search(string, pos) for pattern in self.patterns]
+        while (True):
+            best = None
+            for index, match in enumerate(matches):
+                if (match is not None and (best is None or match.start() < matches[best].start())):
+                    best = index
+            if (best is None):
+                return
+            match = matches[best]
+            yield RuleMatch(match, best+1)
+            position = match.end()
+            empty = match.start() == position # the next match must not be empty at the same position
+            for index, other in enumerate(matches):
+                if (other is not None and (other.start() < position or (empty and other.start() == other.end() == position))):
+                    other = self.patterns[index].search(string, position)
+                    if (empty and other is not None and other.start() == other.end() == position):
+                        other = self.patterns[index].search(string, position+1) if position < len(string) else None
+                    matches[index] = other
+    def search(self, string:str, pos:int=0) -> RuleMatch:
+        return next(self.finditer(string, pos), None)
+    def sub(self, repl, string:str) -> str:
+        parts = []
+        position = 0
+        for match in self.finditer(string):
+            parts += [string[position:match.start()], repl(match) if callable(repl) else match.expand(repl)]
+            position = match.end()
+        parts.append(string[position:])
+        return "".join(parts)
+
+class Rule:
+    def __init__(self, search:str, replace:str=None, regex:bool=True, engine:str="re", location:str=None):
+        self.search = search
+        self.replace = replace
+        self.regex = regex
+        self.engine = engine
+        self.location = location # where the rule was given, e.g. "Line 3"
+        self.template = replace
+        if (engine == "re2" and replace is not None):
+            # re2 decodes the template with unicode_escape, which reads it as Latin-1. escaped, other characters survive.
+            self.template = replace.encode("ascii", "backslashreplace").decode("ascii")
+        try:
+            self.pattern = compile_pattern(search if regex else re.escape(search), engine)
+        except re.error as e:
+            if (location is None):
+                raise
+            raise re.error(f"{location} {self}: {e.msg}", e.pattern) from None
+    def __str__(self):
+        return f"„{self.search}“" if self.regex else f"»{self.search}«"
+    @property
+    def literal(self):
+        """The needle if this rule searches for literal text, None otherwise."""
+        if (self.regex and any(c in REGEX_SPECIAL_CHARACTERS for c in self.search)):
+            return None
+        return self.search
+    @property
+    def refers_to_groups(self) -> bool:
+        """Whether the pattern refers to its groups by number or name. Such rules cannot be combined with others."""
+        return self.regex and GROUP_REFERENCE.search(self.search) is not None
+    def expand(self, match):
+        """Return the replacement for a match of this rule's own pattern."""
+        if (self.regex):
+            return match.expand(self.template)
+        return self.replace
+
+class RuleSet:
+    """Search and replace rules which are applied in one pass.
+
+    All needles are combined into one alternation which is searched from left to right.
+    Where several rules match at the same position, the rule listed first wins.
+    Several rules which are all literal are searched with a LiteralPattern instead.
+    Rules which cannot be combined (e.g. referring to their own groups) are searched one by one with a MultiPattern."""
+    def __init__(self, rules:List[Rule]):
+        if (not rules):
+            raise ValueError("At least one rule is needed.")
+        self.rules = rules
+        self.replacing = all(rule.replace is not None for rule in rules) # callers which replace call check_replacing
+        if (len(rules) == 1):
+            # a single rule is searched as it is. references to groups in the replacement keep working.
+            self.pattern = rules[0].pattern
+            self.rule_by_group = None
+        elif (all(not rule.regex and rule.search for rule in rules)):
+            self.pattern = LiteralPattern([rule.search for rule in rules])
+            self.rule_by_group = {index+1:index for index in range(len(rules))}
+        else:
+            self.pattern = None
+            if (not any(rule.refers_to_groups for rule in rules)):
+                try:
+                    # each rule becomes a named group. the group which closed last tells which rule matched.
+                    self.pattern = compile_pattern("|".join(f"(?P<rule{index}>{rule.pattern.pattern})" for index, rule in enumerate(rules)), rules[0].engine)
+                    self.rule_by_group = {self.pattern.groupindex[f"rule{index}"]:index for index in range(len(rules))}
+                except re.error:
+                    pass # e.g. a group name used by several rules or flags which apply to the whole pattern
+            if (self.pattern is None):
+                self.pattern = MultiPattern([rule.pattern for rule in rules])
+                self.rule_by_group = {index+1:index for index in range(len(rules))}
+    @classmethod
+    def from_arguments(cls, search:str, replace:str=None, regex:bool=True, engine:str="re"):
+        return cls([Rule(search, replace, regex, engine)])
+    @classmethod
+    def from_entries(cls, entries:List[dict], engine:str="re"):
+        """Create rules from a list of objects with the keys search, replace and regex (defaults to false)."""
+        return cls([Rule(entry["search"], entry.get("replace"), bool(entry.get("regex", False)), engine, f"Rule {index+1}") for index, entry in enumerate(entries)])
+    @classmethod
+    def from_file(cls, filename:str, engine:str="re"):
+        """Load rules from a JSON or CSV file.
+
+        JSON files contain a list of objects with the keys search, replace and regex (defaults to false).
+        CSV files contain one rule per row: search, replace and an optional third column reading "regex"."""
+        rules = []
+        with open(filename, newline="", encoding="utf-8") as f:
+            if (filename.lower().endswith(".json")):
+                return cls.from_entries(json.load(f), engine)
+            else:
+                reader = csv.reader(f)
+                for row in reader:
+                    if (not row):
+                        continue
+                    replace = row[1] if len(row) > 1 else None
+                    regex = len(row) > 2 and row[2].strip().lower() == "regex"
+                    rules.append(Rule(row[0], replace, regex, engine, f"Line {reader.line_num}"))
+        return cls(rules)
+    def check_replacing(self):
+        """Raise a ValueError naming the first rule without a replacement."""
+        for index, rule in enumerate(self.rules):
+            if (rule.replace is None):
+                raise ValueError(f"{rule.location or f'Rule {index+1}'} {rule} has no replacement.")
+    def rule_index(self, match) -> int:
+        if (self.rule_by_group is None):
+            return 0
+        return self.rule_by_group[match.lastindex]
+    def expand(self, match) -> str:
+        if (self.rule_by_group is None):
+            rule = self.rules[0]
+            return rule.expand(match)
+        rule = self.rules[self.rule_index(match)]
+        if (not rule.regex):
+            return rule.replace
+        if (isinstance(match, RuleMatch)):
+            return rule.expand(match.match)
+        # match the rule on its own so its replacement can refer to its own groups
+        return rule.expand(rule.pattern.match(match.string, match.start(0)))
+    def sub(self, text:str) -> str:
+        return self.pattern.sub(self.expand, text)
+    def count(self, matches) -> List[int]:
+        counts = [0]*len(self.rules)
+        for match in matches:
+            counts[self.rule_index(match)] += 1
+        return counts
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+from .rules import ENGINES, RuleSet
+from .log import PACKAGE_LOGGER_NAME
+
+MAX_HEADER_SIZE = 64*1024
+IDLE_TIMEOUT = 60 # seconds a kept-alive connection may wait for the next request
+RULE_SET_CACHE_SIZE = 256
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 408: "Request Timeout", 411: "Length Required",
+    413: "Content Too Large", 422: "Unprocessable Content", 431: "Request Header Fields Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    def __init__(self, status:int, message:str):
+        super().__init__(message)
+        self.status = status
+
+class RuleSetCache:
+    """Compiled rule sets by their JSON description. The least recently used rule sets are dropped first."""
+    def __init__(self, size:int=RULE_SET_CACHE_SIZE, engine:str="re"):
+        self.size = size
+        self.engine = engine
+        self.rule_sets = OrderedDict() # type: OrderedDict[str, RuleSet]
+    def get(self, key:str) -> RuleSet:
+        if (key is None):
+            return None
+        rule_set = self.rule_sets.get(key)
+        if (rule_set is None):
+            rule_set = self.rule_sets[key] = RuleSet.from_entries(json.loads(key), self.engine)
+            if (len(self.rule_sets) > self.size):
+                self.rule_sets.popitem(last=False)
+        else:
+            self.rule_sets.move_to_end(key)
+        return rule_set
+
+# state of a worker process. it lives as long as the server.
+font_repository = None
+rule_set_cache = None # type: RuleSetCache
+page_timeout = None # type: float
+
+def initialize_worker(repository, engine:str="re", timeout:float=None):
+    global font_repository, rule_set_cache, page_timeout
+    logger = logging.getLogger(PACKAGE_LOGGER_NAME)
+    logger.propagate = False # warnings are part of the response
+    from . import api # import pypdf and everything else before the first request arrives
+    font_repository = repository
+    rule_set_cache = RuleSetCache(engine=engine)
+    page_timeout = timeout
+
+def warm_up(_) -> int:
+    return os.getpid()
+
+def process_request(action:str, data:bytes, rules_key:str, options:dict) -> dict:
+    """Run in a worker process. Returns what goes into the response."""
+    from .api import replace, search
+    rules = rule_set_cache.get(rules_key)
+    if (action == "search"):
+        return {"report": search(data, rules, options.get("max_matches"), options.get("pages"), page_timeout)}
+    result = replace(data, rules, options["delete"], None, font_repository, options["compress"], options["incremental"], options["compression_level"], options["text_only"], page_timeout, options.get("pages"))
+    return {"output": result.output, "occurrences": result.occurrences, "warnings": result.warnings, "missing_glyph_error": result.missing_glyph_error,
+        "pages": len(result.pages), "skipped_pages": sum(1 for page in result.pages if page.skipped),
+        "timed_out_pages": [page.page_index+1 for page in result.pages if page.timed_out]}
+
+def get_flag(query:Dict[str, List[str]], name:str) -> bool:
+    return query.get(name, ["0"])[-1].lower() in ("", "1", "true", "yes")
+
+def get_integer(query:Dict[str, List[str]], name:str, default:int=None, minimum:int=0, maximum:int=None) -> int:
+    if (name not in query):
+        return default
+    try:
+        value = int(query[name][-1])
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer.")
+    if (value < minimum or (maximum is not None and value > maximum)):
+        raise HTTPError(400, f"{name} is out of range.")
+    return value
+
+def get_rules_key(query:Dict[str, List[str]]) -> str:
+    """Describe the rules of a request as JSON (like a rules file). Rules given as search and replace are regular expressions unless literal is set."""
+    if ("rules" in query and "search" in query):
+        raise HTTPError(400, "rules cannot be combined with search.")
+    if ("rules" in query):
+        try:
+            entries = json.loads(query["rules"][-1])
+            if (not isinstance(entries, list) or not all(isinstance(entry, dict) and isinstance(entry.get("search"), str) for entry in entries)):
+                raise ValueError("rules must be a list of objects with a search string.")
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid rules: {e}")
+    elif ("search" in query):
+        entries = [{"search": query["search"][-1], "replace": query["replace"][-1] if "replace" in query else None, "regex": not get_flag(query, "literal")}]
+    else:
+        return None
+    return json.dumps([{"search": entry["search"], "replace": entry.get("replace"), "regex": bool(entry.get("regex", False))} for entry in entries], ensure_ascii=False)
+
+def get_page_selection(query:Dict[str, List[str]]) -> str:
+    if ("pages" not in query):
+        return None
+    from .document import parse_page_selection
+    selection = query["pages"][-1]
+    try:
+        parse_page_selection(selection)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    return selection
+
+def get_percentile(values:List[float], percentile:float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if (not values):
+        return None
+    return values[min(len(values)-1, max(0, round(percentile/100*len(values))-1))]
+
+class ServerStats:
+    """Counts requests and keeps the latencies of the most recent ones."""
+    def __init__(self, window:int=1000):
+        self.start = time.monotonic()
+        self.statuses = {} # type: Dict[int, int]
+        self.rejected = 0 # requests turned away because of the queue limit
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.processed = 0 # documents answered with 200
+        self.latencies = deque(maxlen=window) # seconds from reading the request to sending the response
+        self.finished = deque() # times the requests of the last minute finished at
+    def record(self, status:int, seconds:float, bytes_in:int, bytes_out:int):
+        now = time.monotonic()
+        self.statuses[status] = self.statuses.get(status, 0)+1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        if (status == 200 and bytes_in): # documents only, not /stats
+            self.processed += 1
+            self.latencies.append(seconds)
+            self.finished.append(now)
+        while (self.finished and self.finished[0] < now-60):
+            self.finished.popleft()
+    def to_dict(self, active:int, queued:int, workers:int) -> dict:
+        uptime = time.monotonic()-self.start
+        latencies = sorted(self.latencies)
+        return {
+            "uptime": uptime, "workers": workers, "active": active, "queued": queued,
+            "requests": sum(self.statuses.values()), "statuses": {str(status): count for status, count in sorted(self.statuses.items())}, "rejected": self.rejected,
+            "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+            "throughput": {"overall": self.processed/uptime if uptime else None, "last_minute": len(self.finished)/min(60, uptime) if uptime else None},
+            "latency": {"window": len(latencies), **{f"p{percentile}": get_percentile(latencies, percentile) for percentile in (50, 90, 99)}, "max": latencies[-1] if latencies else None},
+        }
+
+class Server:
+    """Search and replace over HTTP/1.1. Rules, fonts and imports stay warm in a pool of worker processes.
+
+    At most max_active requests are processed at a time, at most max_queued more wait for a worker.
+    Further requests are answered with 503 before their body is read. Bodies larger than max_size are refused with 413."""
+    def __init__(self, jobs:int, font_repository=None, max_size:int=64*1024*1024, max_active:int=None, max_queued:int=None, engine:str="re", page_timeout:float=None):
+        self.jobs = jobs
+        self.font_repository = font_repository
+        self.engine = engine
+        self.page_timeout = page_timeout
+        self.max_size = max_size
+        self.max_active = max_active or jobs
+        self.max_queued = jobs*4 if max_queued is None else max_queued
+        self.executor = None
+        self.semaphore = None
+        self.pending = 0 # admitted requests, active or waiting
+        self.rule_set_cache = RuleSetCache(engine=engine) # validates rules before they are sent to a worker
+        self.stats = ServerStats()
+    def start_workers(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=initialize_worker, initargs=(self.font_repository, self.engine, self.page_timeout))
+        list(self.executor.map(warm_up, range(self.jobs)))
+    def close(self):
+        if (self.executor is not None):
+            self.executor.shutdown(cancel_futures=True)
+    async def serve(self, host:str=None, port:int=None, unix_path:str=None):
+        self.semaphore = asyncio.Semaphore(self.max_active)
+        if (unix_path):
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path, limit=MAX_HEADER_SIZE)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_SIZE)
+        async with server:
+            await server.serve_forever()
+    async def handle_connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        try:
+            keep_alive = True
+            while (keep_alive):
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                except asyncio.LimitOverrunError:
+                    self.stats.record(431, 0, 0, 0)
+                    self.write_response(writer, 431, {"error": "The request header is too large."}, keep_alive=False)
+                    break
+                start = time.monotonic()
+                status, body, headers, keep_alive, bytes_in = await self.handle_request(head, reader)
+                self.stats.record(status, time.monotonic()-start, bytes_in, len(body) if isinstance(body, bytes) else 0)
+                self.write_response(writer, status, body, headers, keep_alive)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    async def handle_request(self, head:bytes, reader:asyncio.StreamReader) -> tuple:
+        """Returns status, body, extra headers, whether the connection can be kept and the length of the document read."""
+        try:
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, version = lines[0].split(" ")
+            headers = {}
+            for line in lines[1:]:
+                if (line):
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+        except ValueError:
+            return 400, {"error": "Malformed request."}, None, False, 0
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        url = urlsplit(target)
+        query = parse_qs(url.query, keep_blank_values=True)
+        try:
+            if (url.path == "/stats"):
+                if (method != "GET"):
+                    raise HTTPError(405, "Use GET.")
+                return 200, self.stats.to_dict(min(self.pending, self.max_active), max(0, self.pending-self.max_active), self.jobs), None, keep_alive, 0
+            if (url.path not in ("/replace", "/search")):
+                raise HTTPError(404, f"There is no {url.path}.")
+            if (method != "POST"):
+                raise HTTPError(405, "Use POST with the PDF document as body.")
+            action = url.path[1:]
+            rules_key = get_rules_key(query)
+            options = {
+                "delete": get_flag(query, "delete"), "compress": get_flag(query, "compress"), "incremental": get_flag(query, "incremental"),
+                "text_only": get_flag(query, "text_only"), "compression_level": get_integer(query, "compression_level", 6, 0, 9), "max_matches": get_integer(query, "max_matches", minimum=1),
+                "pages": get_page_selection(query),
+            }
+            if (rules_key is None and (action == "search" or not options["delete"])):
+                raise HTTPError(400, "Give search, rules or delete.")
+            try:
+                rules = self.rule_set_cache.get(rules_key)
+                if (action == "replace" and rules is not None and not options["delete"]):
+                    rules.check_replacing()
+            except Exception as e:
+                raise HTTPError(400, f"Invalid rules: {e}")
+        except HTTPError as e:
+            # the body (if any) is not read. the connection cannot be used any more.
+            return e.status, {"error": str(e)}, None, False, 0
+        if ("transfer-encoding" in headers or "content-length" not in headers):
+            return 411, {"error": "Content-Length is needed."}, None, False, 0
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            return 400, {"error": "Invalid Content-Length."}, None, False, 0
+        if (length > self.max_size):
+            return 413, {"error": f"The document is larger than {self.max_size} bytes."}, None, False, 0
+        if (self.pending >= self.max_active+self.max_queued):
+            self.stats.rejected += 1
+            return 503, {"error": "Too many requests. Try again later."}, {"Retry-After": "1"}, False, 0
+        self.pending += 1
+        try:
+            try:
+                data = await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT)
+            except asyncio.IncompleteReadError:
+                return 400, {"error": "The body is shorter than Content-Length."}, None, False, 0
+            except asyncio.TimeoutError:
+                return 408, {"error": "The body took too long."}, None, False, 0
+            async with self.semaphore:
+                status, body, headers = await self.process(action, data, rules_key, options)
+        finally:
+            self.pending -= 1
+        return status, body, headers, keep_alive, length
+    async def process(self, action:str, data:bytes, rules_key:str, options:dict) -> tuple:
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, process_request, action, data, rules_key, options)
+        except BrokenProcessPool:
+            # a worker died (e.g. out of memory). start over with fresh workers.
+            self.executor.shutdown(wait=False)
+            self.executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=initialize_worker, initargs=(self.font_repository, self.engine, self.page_timeout))
+            return 500, {"error": "The worker processing the document died."}, None
+        except Exception as e:
+            return 422, {"error": f"{type(e).__name__}: {e}"}, None
+        if (action == "search"):
+            return 200, result["report"], None
+        if (result["missing_glyph_error"]):
+            return 422, {"error": result["missing_glyph_error"], "occurrences": result["occurrences"], "warnings": result["warnings"]}, None
+        headers = {
+            "X-Occurrences": str(sum(result["occurrences"])), "X-Occurrences-Per-Rule": ",".join(str(count) for count in result["occurrences"]),
+            "X-Pages": str(result["pages"]), "X-Skipped-Pages": str(result["skipped_pages"]), "X-Timed-Out-Pages": ",".join(str(page) for page in result["timed_out_pages"]), "X-Warnings": str(len(result["warnings"])),
+        }
+        return 200, result["output"], headers
+    def write_response(self, writer:asyncio.StreamWriter, status:int, body, headers:dict=None, keep_alive:bool=True):
+        if (isinstance(body, bytes)):
+            content_type = "application/pdf"
+        else:
+            content_type = "application/json"
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}", f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines)+"\r\n\r\n").encode("latin-1")+body)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve search and replace over HTTP. Fonts, rules and imports are kept warm between requests.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on. Defaults to 127.0.0.1.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on. Defaults to 8765.")
+    parser.add_argument("--unix", type=str, help="Listen on this Unix domain socket instead.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Amount of worker processes. Defaults to the amount of CPUs.")
+    parser.add_argument("--max-active", type=int, help="Amount of requests processed at a time. Defaults to --jobs.")
+    parser.add_argument("--max-queued", type=int, help="Amount of requests waiting for a worker. More are refused with 503. Defaults to four times --jobs.")
+    parser.add_argument("--max-size", type=float, default=64, help="Largest accepted document in MiB. Defaults to 64.")
+    parser.add_argument('--fonts', type=str, nargs='*', help="Font file(s) or directories of fonts to reference in case of missing glyphs.")
+    parser.add_argument("--font-cache", type=str, help="File (SQLite database) to keep the names and metrics of the fonts in, so they are read only once.")
+    parser.add_argument("--regex-engine", default="re", choices=ENGINES, help="re2 matches in linear time (no backreferences or lookarounds). Needs google-re2.")
+    parser.add_argument("--page-timeout", type=float, help="Leave a page as it is if processing it takes longer than this many seconds.")
+    args = parser.parse_args()
+    if (args.jobs < 1):
+        parser.error("--jobs must be at least 1.")
+    if (args.max_queued is not None and args.max_queued < 0):
+        parser.error("--max-queued must not be negative.")
+    if (args.page_timeout is not None and args.page_timeout <= 0):
+        parser.error("--page-timeout must be positive.")
+    if (args.regex_engine == "re2"):
+        try:
+            import re2
+        except ImportError:
+            parser.error("--regex-engine re2 needs google-re2.")
+
+    font_repository = None
+    if (args.fonts):
+        from .font import create_font_repository
+        font_repository = create_font_repository(args.fonts, args.font_cache)
+        font_repository.close() # workers open the cache on their own
+        print(f"Indexed {len(font_repository.filenames)} fonts.")
+    server = Server(args.jobs, font_repository, int(args.max_size*1024*1024), args.max_active, args.max_queued, args.regex_engine, args.page_timeout)
+    server.start_workers()
+    print(f"Listening on {args.unix or f'http://{args.host}:{args.port}'} with {args.jobs} workers.")
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if (args.unix and os.path.exists(args.unix)):
+            os.remove(args.unix)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+
+class Stats:
+    """Records the wall time of each page and stage, and counts (operations, operands, matches, bytes) per page and in total.
+
+    One page can be profiled with cProfile (or tracemalloc with profile_memory). The profile is dumped to profile_output
+    if given. Otherwise a summary is kept in profile_report."""
+    enabled = True
+    def __init__(self, profile_page:int=None, profile_memory:bool=False, profile_output:str=None):
+        self.pages = [] # type: List[dict]
+        self.stages = {} # type: Dict[str, float] stage → seconds in total
+        self.totals = {} # type: Dict[str, int]
+        self.current = None # the record of the page being processed
+        self.profile_page = profile_page
+        self.profile_memory = profile_memory
+        self.profile_output = profile_output
+        self.profile_report = None # type: str
+        self.start = time.perf_counter()
+    @contextmanager
+    def page(self, page_index:int):
+        self.current = {"page": page_index+1, "seconds": 0, "stages": {}}
+        profiler = self.start_profile() if page_index == self.profile_page else None
+        start = time.perf_counter()
+        try:
+            yield self.current
+        finally:
+            self.current["seconds"] = time.perf_counter()-start
+            if (profiler is not None):
+                self.stop_profile(profiler)
+            self.pages.append(self.current)
+            self.current = None
+    @contextmanager
+    def stage(self, name:str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter()-start
+            self.stages[name] = self.stages.get(name, 0)+seconds
+            if (self.current is not None):
+                self.current["stages"][name] = self.current["stages"].get(name, 0)+seconds
+    def count(self, name:str, amount:int=1):
+        self.totals[name] = self.totals.get(name, 0)+amount
+        if (self.current is not None):
+            self.current[name] = self.current.get(name, 0)+amount
+    def start_profile(self):
+        if (self.profile_memory):
+            import tracemalloc
+            tracemalloc.start()
+            return tracemalloc
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    def stop_profile(self, profiler):
+        if (self.profile_memory):
+            snapshot = profiler.take_snapshot()
+            _, peak = profiler.get_traced_memory()
+            profiler.stop()
+            if (self.profile_output):
+                snapshot.dump(self.profile_output)
+            else:
+                lines = [f"# Peak memory usage while processing page {self.profile_page+1}: {peak/1024:.0f} KiB. Largest allocations still alive:"]
+                lines += [str(statistic) for statistic in snapshot.statistics("lineno")[:20]]
+                self.profile_report = "\n".join(lines)
+            return
+        profiler.disable()
+        if (self.profile_output):
+            profiler.dump_stats(self.profile_output)
+        else:
+            import io
+            import pstats
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(25)
+            self.profile_report = stream.getvalue()
+    def to_dict(self, font_codec_registry=None) -> dict:
+        """Return everything recorded in a form which can be serialized as JSON."""
+        report = {"seconds": time.perf_counter()-self.start, "stages": self.stages, "totals": self.totals}
+        if (font_codec_registry is not None):
+            lookups = font_codec_registry.resolved+font_codec_registry.hits
+            report["font_codecs"] = {"resolved": font_codec_registry.resolved, "hits": font_codec_registry.hits, "hit_rate": font_codec_registry.hits/lookups if lookups else None}
+        report["pages"] = self.pages
+        return report
+
+class NullStats(Stats):
+    """Records nothing. Used when no statistics are requested."""
+    enabled = False
+    profile_report = None
+    def __init__(self):
+        pass
+    def page(self, page_index:int):
+        return nullcontext()
+    def stage(self, name:str):
+        return nullcontext()
+    def count(self, name:str, amount:int=1):
+        pass
+
+NULL_STATS = NullStats()
@@ -0,0 +1,143 @@
+import re
+from io import BytesIO
+from typing import Dict, List, Tuple
+from pypdf.generic import ContentStream
+from .prefilter import INLINE_IMAGE_DATA, INLINE_IMAGE_END, LINE_END, find_literal_string_end
+
+GAP = b"StrreplaceGap" # operator standing for the bytes between two text objects. it is never written.
+
+# the next token which might start a string, hide one, start or end a text object or select a font outside of one
+TOKEN = re.compile(rb"\(|<<|<|%|/[^\s/\[\]()<>{}%]+\s+[-+.0-9]+\s+Tf(?![^\s/\[<(])|(?<![^\s\])>])(BT|ET|BI)(?![^\s/\[<(])")
+
+def find_text_segments(data:bytes) -> List[Tuple[int, int]]:
+    """Return the start and end of all text objects (BT … ET) and of the font selections (Tf) outside of them."""
+    segments = []
+    start = None # start of the current text object
+    position = 0
+    while (True):
+        token = TOKEN.search(data, position)
+        if (token is None):
+            break
+        kind = token.group(0)
+        position = token.end()
+        if (kind == b"("):
+            position, _ = find_literal_string_end(data, position)
+        elif (kind == b"<"):
+            end = data.find(b">", position)
+            position = end+1 if end >= 0 else len(data)
+        elif (kind == b"%"):
+            line_end = LINE_END.search(data, position)
+            position = line_end.end() if line_end else len(data)
+        elif (kind == b"BT"):
+            if (start is None):
+                start = token.start()
+        elif (kind == b"ET"):
+            if (start is not None):
+                segments.append((start, position))
+                start = None
+        elif (kind == b"BI"):
+            image_data = INLINE_IMAGE_DATA.search(data, position)
+            image_end = INLINE_IMAGE_END.search(data, image_data.end() if image_data else position)
+            position = image_end.end() if image_end else len(data)
+        elif (kind.endswith(b"Tf") and start is None):
+            segments.append((token.start(), position))
+    if (start is not None):
+        segments.append((start, len(data)))
+    return segments
+
+class TextObjectStream:
+    """A content stream of which only the text objects and font selections are parsed. The rest is kept as GAP operations."""
+    def __init__(self, data:bytes):
+        self.data = data
+        self.original = None # type: List[tuple] operations as parsed
+        self._operations = None
+        self.segments = {} # type: Dict[int, Tuple[int, int, int]] index of the first operation of a segment → amount of operations, start, end
+        self.gaps = {} # type: Dict[int, Tuple[int, int]] index of a gap operation → start, end
+        self.changed = set() # indexes of operations which have been changed in place
+    @property
+    def operations(self) -> List[tuple]:
+        if (self._operations is None):
+            self._operations = self.original = self.parse()
+        return self._operations
+    @operations.setter
+    def operations(self, operations:List[tuple]):
+        self._operations = operations
+    def parse(self) -> List[tuple]:
+        segments = find_text_segments(self.data)
+        if (not segments):
+            if (not self.data):
+                return []
+            self.gaps[0] = (0, len(self.data))
+            return [([self.data], GAP)]
+        parser = ContentStream(None, None)
+        parser.set_data((b"\n"+GAP+b"\n").join(self.data[start:end] for start, end in segments))
+        parsed = parser.operations
+        if (sum(1 for _, operator in parsed if operator == GAP) != len(segments)-1):
+            # the scanner and pypdf disagree. parse everything.
+            segments = [(0, len(self.data))]
+            parser.set_data(self.data)
+            parsed = parser.operations
+        operations = []
+        previous_end = 0
+        segment_index = 0
+        first = None
+        for element in [(None, GAP)]+parsed+[(None, GAP)]:
+            if (element[1] != GAP):
+                operations.append(element)
+                continue
+            if (first is not None):
+                start, end = segments[segment_index]
+                self.segments[first] = (len(operations)-first, start, end)
+                previous_end = end
+                segment_index += 1
+            start = segments[segment_index][0] if segment_index < len(segments) else len(self.data)
+            if (start > previous_end):
+                self.gaps[len(operations)] = (previous_end, start)
+                operations.append(([self.data[previous_end:start]], GAP))
+            first = len(operations)
+        return operations
+    def mark_changed(self, operations):
+        """Remember which operations are about to be changed. Their operands may be modified in place."""
+        self.changed = {index for index, operation in enumerate(operations) if operation is not None and operation.scheduled_change}
+    def get_data(self) -> bytes:
+        if (self._operations is None or self._operations is self.original):
+            return self.data
+        positions = {id(element): index for index, element in enumerate(self.original)}
+        chunks = [] # bytes and their range in the original data (None for serialized operations)
+        pending = [] # operations to serialize
+        def flush():
+            if (pending):
+                serializer = ContentStream(None, None)
+                serializer.operations = pending[:]
+                chunks.append((serializer.get_data(), None))
+                pending.clear()
+        operations = self._operations
+        operation_index = 0
+        while (operation_index < len(operations)):
+            element = operations[operation_index]
+            index = positions.get(id(element))
+            if (element[1] == GAP):
+                flush()
+                chunks.append((element[0][0], self.gaps.get(index)))
+                operation_index += 1
+                continue
+            segment = self.segments.get(index)
+            if (segment is not None):
+                count = segment[0]
+                if (all(operation_index+offset < len(operations) and operations[operation_index+offset] is self.original[index+offset] and index+offset not in self.changed for offset in range(count))):
+                    flush()
+                    chunks.append((self.data[segment[1]:segment[2]], segment[1:]))
+                    operation_index += count
+                    continue
+            pending.append(element)
+            operation_index += 1
+        flush()
+        output = BytesIO()
+        previous_chunk, previous_range = None, None
+        for chunk, chunk_range in chunks:
+            adjacent = previous_range is not None and chunk_range is not None and previous_range[1] == chunk_range[0]
+            if (not adjacent and previous_chunk and chunk and not previous_chunk[-1:].isspace() and not chunk[:1].isspace()):
+                output.write(b"\n") # keep tokens apart
+            output.write(chunk)
+            previous_chunk, previous_range = chunk, chunk_range
+        return output.getvalue()
@@ -0,0 +1,196 @@
+"""Time the stages of a search and replace on synthetic documents.
+
+Run from anywhere: python3 test/benchmark.py
+The documents are processed by process_document like the tool does (prefilter, several content streams per page and all).
+The stages are the ones recorded by Stats.
+The first run saves its timings as the baseline (test/benchmark_baseline.json). Later runs are compared to it.
+--save-baseline replaces it. Timings depend on the machine, so the baseline is not part of the repository."""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pypdf
+from pypdf.generic import ArrayObject, ByteStringObject, DecodedStreamObject, NameObject, NumberObject, FloatObject
+from createcontent import create_winansi_font, create_charmap_font, add_page
+from pypdf_strreplace.context import FontCodecRegistry
+from pypdf_strreplace.document import compress_content_streams, create_writer, process_document
+from pypdf_strreplace.prefilter import Prefilter
+from pypdf_strreplace.rules import RuleSet
+from pypdf_strreplace.stats import Stats
+
+STAGES = ["open", "fonts", "prefilter", "parse", "operations", "extract_text", "match", "schedule", "apply", "serialize", "compress", "write"]
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua".split()
+NEEDLE = "needle"
+REPLACEMENT = "thread"
+CHARMAP_ALPHABET = " abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.,"
+BASELINE = os.path.join(ROOT, "test", "benchmark_baseline.json")
+
+# name → pages, operators per page, kerning density, font type, encoding, match density, content streams per page
+SCENARIOS = {
+    "type1-winansi": (20, 200, 0.0, "Type1", "winansi", 0.05, 1),
+    "type1-winansi-kerned": (20, 200, 0.3, "Type1", "winansi", 0.05, 1),
+    "truetype-winansi-kerned": (20, 200, 0.3, "TrueType", "winansi", 0.05, 1),
+    "type1-charmap": (20, 200, 0.0, "Type1", "charmap", 0.05, 1),
+    "truetype-charmap-kerned": (20, 200, 0.3, "TrueType", "charmap", 0.05, 1),
+    "dense-matches": (20, 200, 0.3, "TrueType", "winansi", 0.8, 1),
+    "sparse-matches": (200, 100, 0.1, "Type1", "winansi", 0.002, 1),
+    "many-streams": (20, 200, 0.1, "Type1", "winansi", 0.05, 8),
+    "many-pages": (500, 10, 0.1, "Type1", "winansi", 0.05, 1),
+    "long-page": (1, 5000, 0.1, "Type1", "winansi", 0.05, 1),
+}
+
+def generate_document(pages:int, operators:int, kerning:float, font_type:str, encoding:str, match_density:float, streams:int=1, seed:int=0) -> bytes:
+    """Generate a document with one line of text per text showing operator.
+
+    With kerning, each gap between two glyphs gets a kerning number (which splits the string) with that probability and TJ is used instead of Tj.
+    Each line contains the needle with a probability of match_density. The content of each page is split into streams content streams."""
+    generator = random.Random(seed)
+    writer = pypdf.PdfWriter()
+    if (encoding == "charmap"):
+        codes = {character: 0x21+i for i, character in enumerate(reversed(CHARMAP_ALPHABET))} # scrambled on purpose
+        font_dict = writer._add_object(create_charmap_font(writer, "Bench", font_type, codes))
+        encode = lambda text: ByteStringObject(bytes(codes[character] for character in text))
+    else:
+        font_dict = writer._add_object(create_winansi_font("Helvetica" if font_type == "Type1" else "Arial", font_type))
+        encode = lambda text: ByteStringObject(text.encode("Windows-1252"))
+    for _ in range(pages):
+        operations = [
+            (ArrayObject(), b"BT"),
+            ([NameObject("/F1"), NumberObject(10)], b"Tf"),
+            (ArrayObject([NumberObject(20), NumberObject(820)]), b"Td"),
+        ]
+        for _ in range(operators):
+            words = generator.choices(WORDS, k=8)
+            if (generator.random() < match_density):
+                words[generator.randrange(len(words))] = NEEDLE
+            line = " ".join(words)
+            operations.append((ArrayObject([NumberObject(0), NumberObject(-12)]), b"Td"))
+            if (kerning > 0):
+                operands = ArrayObject()
+                start = 0
+                for position in range(1, len(line)):
+                    if (generator.random() < kerning):
+                        operands.append(encode(line[start:position]))
+                        operands.append(FloatObject(round(generator.uniform(-60, 60), 1)))
+                        start = position
+                operands.append(encode(line[start:]))
+                operations.append((ArrayObject([operands]), b"TJ"))
+            else:
+                operations.append((ArrayObject([encode(line)]), b"Tj"))
+        operations.append((ArrayObject(), b"ET"))
+        add_page(writer, 595, 842, {"/F1": font_dict}, operations)
+        if (streams > 1):
+            page = writer.pages[-1]
+            lines = page.get_contents().get_data().splitlines(keepends=True) # one operation per line
+            size = -(-len(lines)//streams)
+            references = ArrayObject()
+            for start in range(0, len(lines), size):
+                stream = DecodedStreamObject()
+                stream.set_data(b"".join(lines[start:start+size]))
+                references.append(writer._add_object(stream))
+            page[NameObject("/Contents")] = references
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+def run_stages(data:bytes, rules:RuleSet) -> dict:
+    """Replace in all pages like the tool does. Returns the time spent in each stage as recorded by Stats and the amount of matches."""
+    stats = Stats()
+    with stats.stage("open"):
+        writer = create_writer(pypdf.PdfReader(BytesIO(data)))
+    counts = process_document(writer, rules, False, None, FontCodecRegistry(), None, Prefilter(rules), stats=stats)
+    with stats.stage("compress"):
+        compress_content_streams(writer.pages)
+    with stats.stage("write"):
+        writer.write(BytesIO())
+    return {stage: stats.stages.get(stage, 0.0) for stage in STAGES}, sum(counts)
+
+def benchmark(parameters:tuple, repeat:int) -> dict:
+    data = generate_document(*parameters)
+    rules = RuleSet.from_arguments(NEEDLE, REPLACEMENT)
+    best = None
+    for _ in range(repeat):
+        timings, occurrences = run_stages(data, rules)
+        best = timings if best is None else {stage: min(best[stage], timings[stage]) for stage in STAGES}
+    best["total"] = sum(best.values())
+    return {"parameters": list(parameters), "size": len(data), "occurrences": occurrences, "seconds": best}
+
+def compare(results:dict, baseline:dict, threshold:float, min_seconds:float) -> list:
+    """Return descriptions of all stages which became slower than the baseline by more than threshold."""
+    regressions = []
+    for name, result in results.items():
+        if (name not in baseline):
+            continue
+        if (baseline[name]["parameters"] != result["parameters"]):
+            print(f"{name}: parameters differ from the baseline. Not compared.")
+            continue
+        for stage, seconds in result["seconds"].items():
+            before = baseline[name]["seconds"].get(stage)
+            if (before is None or max(before, seconds) < min_seconds):
+                continue # too short to be measured reliably
+            if (seconds > before*(1+threshold)):
+                regressions.append(f"{name} {stage}: {before:.3f} s → {seconds:.3f} s (+{(seconds/before-1)*100:.0f} %)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of search and replace on synthetic documents.")
+    parser.add_argument("--scenario", type=str, nargs="+", choices=list(SCENARIOS), help="Scenarios to run. Defaults to all.")
+    parser.add_argument("--pages", type=int, help="Run one custom scenario with this amount of pages instead.")
+    parser.add_argument("--operators", type=int, default=200, help="Text showing operators per page of the custom scenario.")
+    parser.add_argument("--kerning", type=float, default=0.0, help="Probability of a kerning number between two glyphs in the custom scenario.")
+    parser.add_argument("--font-type", default="Type1", choices=["Type1", "TrueType"], help="Font subtype of the custom scenario.")
+    parser.add_argument("--encoding", default="winansi", choices=["winansi", "charmap"], help="WinAnsiEncoding or a ToUnicode CMap only.")
+    parser.add_argument("--match-density", type=float, default=0.05, help="Probability of a line containing the needle in the custom scenario.")
+    parser.add_argument("--streams", type=int, default=1, help="Content streams per page of the custom scenario.")
+    parser.add_argument("--scale", type=float, default=1, help="Multiply the amount of pages of all scenarios (to find scaling limits).")
+    parser.add_argument("--repeat", type=int, default=3, help="Run each scenario this often and keep the fastest time per stage.")
+    parser.add_argument("--baseline", type=str, default=BASELINE, help="Baseline file.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline instead of comparing. The first run does this anyway.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative slowdown of a stage which counts as regression.")
+    parser.add_argument("--min-seconds", type=float, default=0.01, help="Stages faster than this are not compared.")
+    parser.add_argument("--generate", type=str, help="Only write the document of the first scenario to this file.")
+    args = parser.parse_args()
+
+    if (args.pages):
+        scenarios = {"custom": (args.pages, args.operators, args.kerning, args.font_type, args.encoding, args.match_density, args.streams)}
+    else:
+        scenarios = {name: SCENARIOS[name] for name in (args.scenario or SCENARIOS)}
+    scenarios = {name: (max(1, round(parameters[0]*args.scale)),)+parameters[1:] for name, parameters in scenarios.items()}
+    if (args.generate):
+        with open(args.generate, "wb") as f:
+            f.write(generate_document(*next(iter(scenarios.values()))))
+        return
+
+    results = {}
+    print(f"{'scenario':<24}" + "".join(f"{stage:>{len(stage)+2}}" for stage in STAGES+["total"]))
+    for name, parameters in scenarios.items():
+        result = results[name] = benchmark(parameters, args.repeat)
+        print(f"{name:<24}" + "".join(f"{result['seconds'][stage]:>{len(stage)+2}.4f}" for stage in STAGES+["total"]))
+
+    if (args.save_baseline or not os.path.exists(args.baseline)):
+        baseline = {}
+        if (os.path.exists(args.baseline)):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Saved baseline to {args.baseline}. Later runs are compared to it.")
+    else:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_seconds)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        print(f"{len(regressions)} regressions beyond {args.threshold*100:.0f} %.")
+        if (regressions):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Create the documents test.sh checks which are not part of pdfs/.
+
+Run from anywhere: python3 test/create_documents.py DIRECTORY
+shared_streams.pdf: three pages with several content streams each. One stream is shared by all pages, some texts are split across streams.
+forms.pdf: two pages showing the same form XObject, which shows a nested form XObject.
+slow_forms.pdf: like forms.pdf with the font DejaVuSans. The nested form shows a long run of one letter to search slowly in.
+separate_pages.pdf: the page of pdfs/Inkscape.pdf three times, with separate resources and content streams but the same fonts."""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pypdf
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+from createcontent import create_winansi_font
+
+def add_stream(writer:pypdf.PdfWriter, data:bytes, form_resources:DictionaryObject=None):
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    if (form_resources is not None):
+        stream[NameObject("/Type")] = NameObject("/XObject")
+        stream[NameObject("/Subtype")] = NameObject("/Form")
+        stream[NameObject("/BBox")] = ArrayObject([NumberObject(0), NumberObject(0), NumberObject(595), NumberObject(842)])
+        stream[NameObject("/Resources")] = form_resources
+    return writer._add_object(stream)
+
+def create_shared_streams(path:str):
+    """Each page shows "Hello" five times: in the shared stream, split across two streams, in its own stream and (last page only) twice more."""
+    writer = pypdf.PdfWriter()
+    font = writer._add_object(create_winansi_font("Helvetica"))
+    shared = add_stream(writer, b"BT /F1 10 Tf 20 800 Td (Shared header Hello) Tj ET")
+    for index in range(3):
+        page = writer.add_blank_page(595, 842)
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        streams = [
+            shared,
+            add_stream(writer, b"0 0 1 rg 10 10 100 100 re f"),
+            add_stream(writer, b"BT /F1 12 Tf 50 700 Td (Hel) Tj"),
+            add_stream(writer, b"(lo World) Tj ET"),
+            add_stream(writer, b"BT /F1 12 Tf 50 600 Td (page %d Hello) Tj ET" % (index+1)),
+        ]
+        if (index == 2):
+            streams.append(add_stream(writer, b"BT /F1 12 Tf 50 500 Td (split"))
+            streams.append(add_stream(writer, b"Hello) Tj ET"))
+        page[NameObject("/Contents")] = ArrayObject(streams)
+    writer.write(path)
+
+def create_forms(path:str, font_name:str="Helvetica", nested_text:bytes=b"Nested Hello"):
+    writer = pypdf.PdfWriter()
+    font = writer._add_object(create_winansi_font(font_name))
+    fonts = DictionaryObject({NameObject("/F1"): font})
+    nested = add_stream(writer, b"BT /F1 12 Tf 50 600 Td (%s) Tj ET" % nested_text, DictionaryObject({NameObject("/Font"): fonts}))
+    form = add_stream(writer, b"BT /F1 12 Tf 50 700 Td (Form Hello) Tj ET q /Fm2 Do Q", DictionaryObject({
+        NameObject("/Font"): fonts, NameObject("/XObject"): DictionaryObject({NameObject("/Fm2"): nested}),
+    }))
+    for index in range(2):
+        page = writer.add_blank_page(595, 842)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): fonts, NameObject("/XObject"): DictionaryObject({NameObject("/Fm1"): form}),
+        })
+        page[NameObject("/Contents")] = add_stream(writer, b"BT /F1 12 Tf 50 800 Td (Page %d Hello) Tj ET q /Fm1 Do Q" % (index+1))
+    writer.write(path)
+
+def create_separate_pages(path:str):
+    writer = pypdf.PdfWriter(clone_from=os.path.join(ROOT, "pdfs", "Inkscape.pdf"))
+    source = writer.pages[0]
+    for _ in range(2):
+        page = writer.add_blank_page(source.mediabox.width, source.mediabox.height)
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject(source["/Resources"]["/Font"])}) # the same font objects
+        page[NameObject("/Contents")] = add_stream(writer, source.get_contents().get_data())
+    writer.write(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the documents test.sh checks.")
+    parser.add_argument("directory", help="Directory to write the documents to.")
+    args = parser.parse_args()
+    create_shared_streams(os.path.join(args.directory, "shared_streams.pdf"))
+    create_forms(os.path.join(args.directory, "forms.pdf"))
+    create_forms(os.path.join(args.directory, "slow_forms.pdf"), "AAAAAA+DejaVuSans", b"Nested "+b"a"*60)
+    create_separate_pages(os.path.join(args.directory, "separate_pages.pdf"))
@@ -1,5 +1,183 @@
 cd "$(dirname "$0")"/..
 
+# checks of the text and the reports (these do not need GraphicsMagick)
+documents="$(mktemp -d "/tmp/test.documents.XXXXXXXXXX")"
+python3 test/create_documents.py "$documents"
+font="${DEJAVU_SANS:-/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf}"
+
+list_text() {
+    python3 -m pypdf_strreplace.main --input "$1" | grep -v "^#"
+}
+
+# search only (--count) and compare the amount of occurrences
+do_count() {
+    echo "Test $1…"
+    expected="$2"
+    shift 2
+    occurrences="$(timeout --verbose 10 python3 -m pypdf_strreplace.main --count "$@" | python3 -c 'import json, sys; print(json.load(sys.stdin)["occurrences"])')"
+    if [ "$occurrences" = "$expected" ]
+    then
+        echo "OK"
+    else
+        echo -e "\033[31;1mTest failed!\033[0m Expected $expected occurrences, found $occurrences."
+    fi
+}
+
+# replace and look for a line in the text of the output
+do_text() {
+    echo "Test $1…"
+    tmpdir="$(mktemp -d "/tmp/test.$1.XXXXXXXXXX")"
+    line="$2"
+    shift 2
+    timeout --verbose 10 python3 -m pypdf_strreplace.main --output "$tmpdir"/output.pdf "$@" > "$tmpdir"/messages.log
+    if list_text "$tmpdir"/output.pdf | grep -qxF -- "$line"
+    then
+        echo "OK"
+    else
+        echo -e "\033[31;1mTest failed!\033[0m"
+    fi
+    rm -r "$tmpdir"
+}
+
+# replace with and without the option given as third argument. the texts of both outputs must be the same (and differ from the input).
+do_same() {
+    echo "Test $1…"
+    tmpdir="$(mktemp -d "/tmp/test.$1.XXXXXXXXXX")"
+    input="$2"
+    option="$3"
+    shift 3
+    timeout --verbose 10 python3 -m pypdf_strreplace.main --input "$input" --output "$tmpdir"/expected.pdf "$@" > "$tmpdir"/messages.log
+    timeout --verbose 10 python3 -m pypdf_strreplace.main --input "$input" --output "$tmpdir"/output.pdf $option "$@" >> "$tmpdir"/messages.log
+    if ! cmp -s <(list_text "$input") <(list_text "$tmpdir"/expected.pdf) && cmp -s <(list_text "$tmpdir"/expected.pdf) <(list_text "$tmpdir"/output.pdf)
+    then
+        echo "OK"
+    else
+        echo -e "\033[31;1mTest failed!\033[0m"
+    fi
+    rm -r "$tmpdir"
+}
+
+# the tool refuses the invocation
+do_error() {
+    echo "Test $1…"
+    shift
+    if ! timeout --verbose 10 python3 -m pypdf_strreplace.main "$@" > /dev/null 2>&1
+    then
+        echo "OK"
+    else
+        echo -e "\033[31;1mTest failed!\033[0m"
+    fi
+}
+
+# several rules in one pass, the first one referring to its own groups
+printf '(And) (more),\\2 \\1,regex\ntext,fuzz\n' > "$documents"/rules.csv
+echo '[{"search": "(And) (more)", "replace": "\\2 \\1", "regex": true}, {"search": "text", "replace": "fuzz"}]' > "$documents"/rules.json
+do_count "rules_count" 76 --input pdfs/Dmytro.pdf --rules "$documents"/rules.csv
+do_text "rules_csv" " fuzz. more And fuzz. more And fuzz. more And fuzz. " --input pdfs/Dmytro.pdf --rules "$documents"/rules.csv
+do_text "rules_json" " fuzz. more And fuzz. more And fuzz. more And fuzz. " --input pdfs/Dmytro.pdf --rules "$documents"/rules.json
+printf 'Inkscape,pleasure\nPDF\n' > "$documents"/search_only_rule.csv
+do_count "rules_search_only_count" 2 --input pdfs/Inkscape.pdf --rules "$documents"/search_only_rule.csv
+do_error "rules_search_only_replace" --input pdfs/Inkscape.pdf --rules "$documents"/search_only_rule.csv --output /dev/null
+
+# non-ASCII replacements with the linear-time engine
+if python3 -c "import re2" 2> /dev/null
+then
+    do_text "re2_non_ascii" " tëxt€. And more tëxt€. And more tëxt€. And more tëxt€. " --input pdfs/Dmytro.pdf --search "te(x)t" --replace 'të\1t€' --regex-engine re2
+else
+    echo "Skipped re2 tests, google-re2 is not installed."
+fi
+
+# a page timeout also applies to searching
+echo "Test count_timeout…"
+if python3 -m pypdf_strreplace.main --input pdfs/Dmytro.pdf --count --page-timeout 1 --search "(.|..)*#" | python3 -c 'import json, sys; sys.exit(json.load(sys.stdin)["timed_out_pages"] != [1, 2])'
+then
+    echo "OK"
+else
+    echo -e "\033[31;1mTest failed!\033[0m"
+fi
+
+# page selection
+do_count "pages_single" 13 --input pdfs/Dmytro.pdf --search text --pages 2
+do_count "pages_negative" 13 --input pdfs/Dmytro.pdf --search text --pages=-1
+do_count "pages_negative_range" 6 --input "$documents"/shared_streams.pdf --search Hello --pages=-2--1
+do_count "pages_open_range" 6 --input "$documents"/shared_streams.pdf --search Hello --pages 2-
+do_error "pages_reversed" --input pdfs/Dmytro.pdf --search text --count --pages 3-1
+do_error "pages_reversed_negative" --input pdfs/Dmytro.pdf --search text --count --pages=-1--2
+do_error "pages_none" --input pdfs/Dmytro.pdf --search text --replace fuzz --pages 3 --output /dev/null
+do_text "pages_unselected" " text. And more text. And more text. And more text. " --input pdfs/Dmytro.pdf --search text --replace fuzz --pages 2
+do_text "pages_selected" " Boring.  More, a little more fuzz. The end, and just as well. " --input pdfs/Dmytro.pdf --search text --replace fuzz --pages 2
+
+# other ways of processing give the same text
+do_same "text_only" pdfs/LibreOffice.pdf --text-only --search "PDF file" --replace "text document"
+do_same "text_only_kerned" pdfs/xelatex.pdf --text-only --search symbol --replace character
+do_same "jobs" pdfs/Dmytro.pdf "--jobs 2" --search text --replace fuzz
+do_same "jobs_shared_streams" "$documents"/shared_streams.pdf "--jobs 2" --search Hello --replace Bye
+do_same "incremental" pdfs/Inkscape.pdf --incremental --search "Inkscape 1.1.2" --replace pleasure
+do_same "incremental_shared_streams" "$documents"/shared_streams.pdf --incremental --search Hello --replace Bye
+do_same "streaming_shared_streams" "$documents"/shared_streams.pdf --streaming --search Hello --replace Bye
+
+# form XObjects (shared by both pages, one nested in the other) are searched once
+do_count "forms_count" 4 --input "$documents"/forms.pdf --search Hello
+do_text "forms_nested" "Nested Bye" --input "$documents"/forms.pdf --search Hello --replace Bye
+do_same "forms_text_only" "$documents"/forms.pdf --text-only --search Hello --replace Bye
+echo "Test forms_compressed…"
+python3 -m pypdf_strreplace.main --input "$documents"/forms.pdf --output "$documents"/forms_compressed.pdf --search Hello --replace Bye --compression-level 9 > /dev/null
+if python3 -c '
+import sys, pypdf
+form = pypdf.PdfReader(sys.argv[1]).pages[0]["/Resources"]["/XObject"]["/Fm1"]
+sys.exit(form.get("/Filter") != "/FlateDecode" or b"Form Bye" not in form.get_data())' "$documents"/forms_compressed.pdf
+then
+    echo "OK"
+else
+    echo -e "\033[31;1mTest failed!\033[0m"
+fi
+
+# a content stream shared by all pages is counted once, matches may span the content streams of a page
+do_count "shared_streams" 8 --input "$documents"/shared_streams.pdf --search Hello
+do_count "cross_streams" 3 --input "$documents"/shared_streams.pdf --search "Hello World"
+do_text "cross_streams_replace" "Bye Earth" --input "$documents"/shared_streams.pdf --search "Hello World" --replace "Bye Earth"
+do_same "cross_streams_text_only" "$documents"/shared_streams.pdf --text-only --search "Hello World" --replace "Bye Earth"
+
+# a fallback font is injected once and shared by all pages
+echo "Test fallback_font_shared…"
+if [ -f "$font" ]
+then
+    python3 -m pypdf_strreplace.main --input "$documents"/separate_pages.pdf --output "$documents"/fallback.pdf --search i --replace ö --fonts "$font" > /dev/null
+    injected="$(python3 -c '
+import sys, pypdf
+fonts = {font.idnum for page in pypdf.PdfReader(sys.argv[1]).pages for font in page["/Resources"]["/Font"].values() if font.get_object()["/BaseFont"] == "/DejaVuSans"}
+print(len(fonts))' "$documents"/fallback.pdf)"
+    if [ "$injected" = "1" ] && [ "$(list_text "$documents"/fallback.pdf | grep -cxF "Thös ös a sample PDF ﬁle created wöth Inkscape 1.1.2 on Ubuntu Lönux.")" = "3" ]
+    then
+        echo "OK"
+    else
+        echo -e "\033[31;1mTest failed!\033[0m"
+    fi
+else
+    echo "Skipped, $font is missing. Set DEJAVU_SANS."
+fi
+
+# a page taking too long is left as it is, even the forms changed and the fonts injected before it ran out of time
+echo "Test timeout_rollback…"
+if [ -f "$font" ]
+then
+    python3 -m pypdf_strreplace.main --input "$documents"/slow_forms.pdf --output "$documents"/slow_forms_output.pdf --search "Hello|(a|aa)*#" --replace Bye --fonts "$font" --page-timeout 1 > /dev/null
+    if cmp -s <(list_text "$documents"/slow_forms.pdf) <(list_text "$documents"/slow_forms_output.pdf) && python3 -c '
+import sys, pypdf
+sys.exit(len(pypdf.PdfReader(sys.argv[1]).pages[0]["/Resources"]["/Font"]) != 1)' "$documents"/slow_forms_output.pdf
+    then
+        echo "OK"
+    else
+        echo -e "\033[31;1mTest failed!\033[0m"
+    fi
+else
+    echo "Skipped, $font is missing. Set DEJAVU_SANS."
+fi
+
+rm -r "$documents"
+
+python3 test/test_server.py
+
 if ! gm -version > /dev/null
 then
     echo -e "\033[31;1mGraphicsMagick is not installed.\033[0m"
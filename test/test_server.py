@@ -0,0 +1,111 @@
+"""Start the server and talk to it as a local client.
+
+Run from anywhere: python3 test/test_server.py
+The server runs with one worker, admits one request at a time (none queued), accepts documents up to 64 KiB and gives each page a second."""
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_SIZE = 64*1024
+
+def get_free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def request(port:int, method:str, path:str, body:bytes=None) -> tuple:
+    """Returns status, headers and body."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+def send_head(port:int, path:str, length:int) -> socket.socket:
+    """Send only the head of a POST request. The server waits for the body (or refuses it)."""
+    client = socket.create_connection(("127.0.0.1", port), timeout=30)
+    client.sendall(f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {length}\r\n\r\n".encode("latin-1"))
+    return client
+
+def read_status(client:socket.socket) -> int:
+    response = b""
+    while (b"\r\n" not in response):
+        chunk = client.recv(4096)
+        if (not chunk):
+            break
+        response += chunk
+    return int(response.split(b" ")[1])
+
+def check(name:str, condition:bool, details=None):
+    print(f"Test {name}…")
+    if (condition):
+        print("OK")
+    else:
+        print("\033[31;1mTest failed!\033[0m")
+        if (details is not None):
+            print(details)
+
+def wait_until_listening(server:subprocess.Popen, port:int):
+    deadline = time.monotonic()+60
+    while (time.monotonic() < deadline and server.poll() is None):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("The server did not start.")
+
+def main():
+    with open(os.path.join(ROOT, "pdfs", "Dmytro.pdf"), "rb") as pdf_file:
+        document = pdf_file.read()
+    port = get_free_port()
+    server = subprocess.Popen([sys.executable, "-m", "pypdf_strreplace.server", "--port", str(port), "--jobs", "1", "--max-active", "1", "--max-queued", "0", "--max-size", str(MAX_SIZE/1024/1024), "--page-timeout", "1"], cwd=ROOT, stdout=subprocess.DEVNULL)
+    try:
+        wait_until_listening(server, port)
+
+        query = urlencode({"search": "text", "replace": "fuzz"})
+        status, headers, body = request(port, "POST", f"/replace?{query}", document)
+        check("server replace", status == 200 and headers.get("X-Occurrences") == "40" and body.startswith(b"%PDF"), (status, headers))
+
+        status, headers, body = request(port, "POST", f"/search?{urlencode({'search': 'text'})}", document)
+        check("server search", status == 200 and json.loads(body)["occurrences"] == 40, (status, body[:200]))
+
+        slow_query = urlencode({"search": r"(.|..)*#"}) # backtracks catastrophically
+        status, headers, body = request(port, "POST", f"/search?{slow_query}", document)
+        check("server search timeout", status == 200 and json.loads(body)["timed_out_pages"] == [1, 2], (status, body[:200]))
+
+        status, headers, body = request(port, "POST", f"/replace?{urlencode({'search': '(', 'replace': 'x'})}", document)
+        check("server invalid rules", status == 400, (status, body))
+
+        client = send_head(port, f"/replace?{query}", MAX_SIZE+1)
+        with client:
+            check("server size limit", read_status(client) == 413)
+
+        # the first request is admitted as soon as its head arrives. it occupies the only place until its body follows.
+        waiting = send_head(port, f"/replace?{query}", len(document))
+        with waiting:
+            time.sleep(0.5)
+            client = send_head(port, f"/replace?{query}", len(document))
+            with client:
+                check("server backpressure", read_status(client) == 503)
+            waiting.sendall(document)
+            check("server admits again", read_status(waiting) == 200)
+
+        status, headers, body = request(port, "GET", "/stats")
+        stats = json.loads(body)
+        check("server stats", status == 200 and stats["rejected"] == 1 and stats["statuses"] == {"200": 4, "400": 1, "413": 1, "503": 1} and stats["active"] == 0, (status, stats))
+    finally:
+        server.send_signal(signal.SIGINT) # shuts the workers down, too
+        server.wait()
+
+if __name__ == "__main__":
+    main()